@@ -1,6 +1,8 @@
-import re
 import argparse
-import collections
+
+from cell_container import cell_inputs, read_cell
+from result_cache import DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE, make_result_cache
+from umi_engine import count_sam_file, run_umi_counting
 
 
 parser = argparse.ArgumentParser('')
@@ -9,268 +11,75 @@ parser.add_argument(
     '--gtf_file', required=True, help='gtf file')
 
 parser.add_argument(
-    '--input_sam_file', required=True, help='input sam file')
+    '--input_sam_file', help='input sam file, or a sam container of all cells when --cell is given')
 
 parser.add_argument(
-    '--counts_file', required=True, help='count file (e.g., "counts.txt")')
-
-args = parser.parse_args()
-
-UPPERCASE = re.compile(r'([A-Z])')
-
-PATTERNS = {
-    'MNM',
-    'SMNM',
-    'MNMS',
-    'MNMDM',
-    'SMNMS',
-    'MDMNM',
-    'MNMIM',
-    'MIMNM',
-    'MNMNM',
-    'SMDMNM',
-    'MNMDMS',
-    'SMNMDM',
-    'SMNMIM',
-    'SMIMNM',
-    'MDMNMS',
-    'MIMNMS',
-    'MNMIMS',
-    'MDMIMNM',
-    'SMDMNMS',
-    'SMNMIMS',
-    'SMIMNMS',
-    'MDMDMNM',
-    'MNMIMIM',
-    'SMNMDMS',
-    'MNMDMDM',
-    'MNMDMIM',
-    'MNMNMS',
-    'MIMDMNM',
-    'MIMIMNM',
-    'MNMIMDM',
-    'MDMNMIMS',
-    'SMIMNMDM',
-    'MIMNMIM',
-    'MIMNMNM',
-    'MDMNMIM',
-    'MIMNMDM',
-    'SMNMNM',
-    'MDMNMDM',
-    'MNMIMNM',
-    'MNMDMNM',
-    'MNMNMIM',
-    'MNMNMDM'
-}
-
-
-def is_header(line):
-    return line.startswith('@')
-
-
-def is_in_range(pattern, cigar, split_line, gtf):
-    segment = split_line[2]
-    info = gtf[segment]
-    firstbase = int(split_line[3])
-
-    if pattern == 'MNM':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][1] + cigar['len'][2] - 1
-
-    if pattern == 'SMNM':
-        lastbase = firstbase + cigar['len'][1] + cigar['len'][2] + cigar['len'][3] - 1
-
-    if pattern == 'MNMS':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][1] + cigar['len'][2] - 1
-
-    if pattern == 'MNMDM':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][1] + cigar['len'][2] + cigar['len'][3] + cigar['len'][4] - 1
-
-    if pattern == 'SMNMS':
-        lastbase = firstbase + cigar['len'][1] + cigar['len'][2] + cigar['len'][3] - 1
-
-    if pattern == 'MDMNM':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][1] + cigar['len'][2] + cigar['len'][3] + cigar['len'][4] - 1
-
-    if pattern == 'MNMIM':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][1] + cigar['len'][2] + cigar['len'][4] - 1
-
-    if pattern == 'MIMNM':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][2] + cigar['len'][3] + cigar['len'][4] - 1
-
-    if pattern == 'MNMNM':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][1] + cigar['len'][2] + cigar['len'][3] + cigar['len'][4] - 1
-
-    if pattern == 'SMDMNM':
-        lastbase = firstbase + cigar['len'][1] + cigar['len'][2] + cigar['len'][3] + cigar['len'][4] + cigar['len'][5] - 1
-
-    if pattern == 'MNMDMS':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][1] + cigar['len'][2] + cigar['len'][3] + cigar['len'][4] - 1
-
-    if pattern == 'SMNMDM':
-        lastbase = firstbase + cigar['len'][1] + cigar['len'][2] + cigar['len'][3] + cigar['len'][4] + cigar['len'][5] - 1
-
-    if pattern == 'SMNMIM':
-        lastbase = firstbase + cigar['len'][1] + cigar['len'][2] + cigar['len'][3] + cigar['len'][5] - 1
-
-    if pattern == 'SMIMNM':
-        lastbase = firstbase + cigar['len'][1] + cigar['len'][3] + cigar['len'][4] + cigar['len'][5] - 1
-
-    if pattern == 'MDMNMS':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][1] + cigar['len'][2] + cigar['len'][3] + cigar['len'][4] - 1
-
-    if pattern == 'MIMNMS':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][2] + cigar['len'][3] + cigar['len'][4] - 1
-
-    if pattern == 'MNMIMS':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][1] + cigar['len'][2] + cigar['len'][4] - 1
-
-    if pattern == 'MDMIMNM':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][1] + cigar['len'][2] + cigar['len'][4] + cigar['len'][5] + cigar['len'][6] - 1
-
-    if pattern == 'SMDMNMS':
-        lastbase = firstbase + cigar['len'][1] + cigar['len'][2] + cigar['len'][3] + cigar['len'][4] + cigar['len'][5] - 1
-
-    if pattern == 'SMNMIMS':
-        lastbase = firstbase + cigar['len'][1] + cigar['len'][2] + cigar['len'][3] + cigar['len'][5] - 1
-
-    if pattern == 'SMIMNMS':
-        lastbase = firstbase + cigar['len'][1] + cigar['len'][3] + cigar['len'][4] + cigar['len'][5] - 1
-
-    if pattern == 'MDMDMNM':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][1] + cigar['len'][2] + cigar['len'][3] + cigar['len'][4] + cigar['len'][5] + cigar['len'][6] - 1
+    '--cell', help='the cell to read from the sam container given as --input_sam_file')
 
-    if pattern == 'MNMIMIM':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][1] + cigar['len'][2] + cigar['len'][4] + cigar['len'][6] - 1
-
-    if pattern == 'SMNMDMS':
-        lastbase = firstbase + cigar['len'][1] + cigar['len'][2] + cigar['len'][3] + cigar['len'][4] + cigar['len'][5] - 1
-
-    if pattern == 'MNMDMDM':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][1] + cigar['len'][2] + cigar['len'][3] + cigar['len'][4] + cigar['len'][5] + cigar['len'][6] - 1
-
-    if pattern == 'MNMDMIM':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][1] + cigar['len'][2] + cigar['len'][3] + cigar['len'][4] + cigar['len'][6] - 1
-
-    if pattern == 'MNMNMS':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][1] + cigar['len'][2] + cigar['len'][3] + cigar['len'][4] - 1
-
-    if pattern == 'MIMDMNM':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][2] + cigar['len'][3] + cigar['len'][4] + cigar['len'][5] + cigar['len'][6] - 1
-
-    if pattern == 'MIMIMNM':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][2] + cigar['len'][4] + cigar['len'][5] + cigar['len'][6] - 1
-
-    if pattern == 'MNMIMDM':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][1] + cigar['len'][2] + cigar['len'][4] + cigar['len'][5] + cigar['len'][6] - 1
-
-    if pattern == 'MDMNMIMS':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][1] + cigar['len'][2] + cigar['len'][3] + cigar['len'][4] + cigar['len'][6] - 1
-
-    if pattern == 'SMIMNMDM':
-        lastbase = firstbase + cigar['len'][1] + cigar['len'][3] + cigar['len'][4] + cigar['len'][5] + cigar['len'][6] + cigar['len'][7] - 1
-
-    if pattern == 'MIMNMIM':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][2] + cigar['len'][3] + cigar['len'][4] + cigar['len'][6] - 1
-
-    if pattern == 'MIMNMNM':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][2] + cigar['len'][3] + cigar['len'][4] + cigar['len'][5] + cigar['len'][6] - 1
-
-    if pattern == 'MDMNMIM':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][1] + cigar['len'][2] + cigar['len'][3] + cigar['len'][4] + cigar['len'][6] - 1
-
-    if pattern == 'MIMNMDM':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][2] + cigar['len'][3] + cigar['len'][4] + cigar['len'][5] + cigar['len'][6] - 1
-
-    if pattern == 'SMNMNM':
-        lastbase = firstbase + cigar['len'][1] + cigar['len'][2] + cigar['len'][3] + cigar['len'][4] + cigar['len'][5] - 1
-
-    if pattern == 'MDMNMDM':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][1] + cigar['len'][2] + cigar['len'][3] + cigar['len'][4] + cigar['len'][5] + cigar['len'][6] - 1
+parser.add_argument(
+    '--counts_file', help='count file (e.g., "counts.txt")')
 
-    if pattern == 'MNMIMNM':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][1] + cigar['len'][2] + cigar['len'][4] + cigar['len'][5] + cigar['len'][6] - 1
+parser.add_argument(
+    '--input_sam_files', nargs='+', help='input sam files of many cells, counted in one run (batch mode, in place of --input_sam_file)')
 
-    if pattern == 'MNMDMNM':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][1] + cigar['len'][2] + cigar['len'][3] + cigar['len'][4] + cigar['len'][5] + cigar['len'][6] - 1
+parser.add_argument(
+    '--container', help='a sam container of all cells with its cell offset index (written by separate_sc-sam-alignment_10Xoutput.py --container), whose cells are counted in one run (batch mode)')
 
-    if pattern == 'MNMNMIM':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][1] + cigar['len'][2] + cigar['len'][3] + cigar['len'][4] + cigar['len'][6] - 1
+parser.add_argument(
+    '--cells', nargs='+', help='the cells to read from --container (default: all)')
 
-    if pattern == 'MNMNMDM':
-        lastbase = firstbase + cigar['len'][0] + cigar['len'][1] + cigar['len'][2] + cigar['len'][3] + cigar['len'][4] + cigar['len'][5] + cigar['len'][6] - 1
+parser.add_argument(
+    '--output_dir', help='the directory for the output files of each cell (batch mode): <cell>_all_UMI_counts.txt with the UMI counts')
 
-    return (info['min'] <= firstbase) and (lastbase <= info['max'])
+parser.add_argument(
+    '--matrix', help='a csv file of the counts of all cells, one column per cell (batch mode)')
 
+parser.add_argument(
+    '-j', '--jobs', type=int, default=1, help='the number of worker processes counting cells in parallel (batch mode, default: 1)')
 
-def extract_align_info(split_line):
-    sposition1 = int(split_line[3])
-    cigar = {'cha': [], 'len': []}
-    last = None
-    for i, s in enumerate(re.split(UPPERCASE, split_line[5])):
-        if s:
-            if i % 2 == 0:
-                last = int(s)
-            else:
-                cigar['cha'].append(s)
-                cigar['len'].append(last)
-    return sposition1, cigar
+parser.add_argument(
+    '--cb_list', help='cell barcode list; if given, only alignments whose CB tag is in the list are counted')
 
+parser.add_argument(
+    '--cache_dir', default=DEFAULT_CACHE_DIR, help='the directory of the result cache, which keeps the results of each input by its content and the parameters so unchanged inputs are skipped on re-runs (default: %s)' % DEFAULT_CACHE_DIR)
 
-def assgined_to_gene (split_line):
-    for s in split_line:
-        if s.startswith('GX:Z:'):
-            return True
-    return False
+parser.add_argument(
+    '--cache_size', type=int, default=DEFAULT_CACHE_SIZE >> 20, help='the maximum size of the result cache in MB, beyond which the least recently used results are removed (default: %d)' % (DEFAULT_CACHE_SIZE >> 20))
 
+parser.add_argument(
+    '--no_cache', '--no-cache', action='store_true', help='neither read nor write the result cache')
 
-def extract_umi(split_line):
-    for s in split_line:
-        if s.startswith('UB:Z:'):
-            return s[5:]
+args = parser.parse_args()
 
 
 def main():
-    gtf = {}
-    with open(args.gtf_file) as f:
-        for line in f:
-            split_line = line.split('\t')
-            gtf[split_line[0]] = {
-                'min': int(split_line[3]),
-                'max': int(split_line[4])
-            }
-
-    headers = []
-    with open(args.input_sam_file) as f:
-        segs = collections.defaultdict(list)
-        for line in f:
-            if not is_header(line):
-                split_line = line.split('\t')
-                segs[split_line[2]].append(split_line)
-            else:
-                headers.append(line)
-
-    segs = collections.OrderedDict(sorted(segs.items(), key=lambda t: t[0]))
-    filtered_segs = collections.OrderedDict()
-    for seg, split_lines in segs.iteritems():
-        umis = set()
-        for split_line in split_lines:
-            sposition1, cigar = extract_align_info(split_line)
-            pattern = ''.join(cigar['cha'])
-            if pattern in PATTERNS:
-                umi = extract_umi(split_line)
-                if umi is not None:
-                    if is_in_range(pattern, cigar, split_line, gtf):
-                        umis.add(umi)
-            elif assgined_to_gene(split_line):
-                umi = extract_umi(split_line)
-                if umi is not None:
-                    umis.add(umi)
-
-        filtered_segs[seg] = len(umis)
-
-    with open(args.counts_file, 'w') as f:
-        for seg, num_unique_umi in filtered_segs.iteritems():
-            f.write('{}\t{}\n'.format(seg, num_unique_umi))
+    batch = args.input_sam_files is not None or args.container is not None
+    if batch == (args.input_sam_file is not None):
+        parser.error('Give either --input_sam_file, or --input_sam_files and/or --container.')
+    if batch and args.output_dir is None and args.matrix is None:
+        parser.error('The batch mode needs --output_dir and/or --matrix.')
+    if not batch and args.counts_file is None:
+        parser.error('--input_sam_file needs --counts_file.')
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1.')
+
+    cache = make_result_cache(args.cache_dir, args.cache_size << 20, args.no_cache)
+    if batch:
+        try:
+            inputs = cell_inputs(args.input_sam_files or [], args.container, args.cells)
+        except ValueError as e:
+            parser.error(str(e))
+        run_umi_counting(inputs, args.gtf_file, ['all_counts'], args.output_dir, {'all_counts': args.matrix},
+                         args.cb_list, args.jobs, cache)
+        return
+
+    input_sam_file = args.input_sam_file
+    if args.cell is not None:
+        try:
+            input_sam_file = read_cell(args.input_sam_file, args.cell)
+        except ValueError as e:
+            parser.error(str(e))
+    count_sam_file(input_sam_file, args.gtf_file, {'all_counts': args.counts_file}, args.cb_list, cache)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,98 @@
+import argparse
+
+from cell_container import cell_inputs, read_cell
+from result_cache import DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE, make_result_cache
+from umi_engine import count_sam_file, run_umi_counting
+
+
+parser = argparse.ArgumentParser('Count the unique UMIs of all the viral alignments (un-gapped and gapped, as Re-count_viral_UMI_8seg_gapped-and-normal_v2.py) and of the gapped alignments with one N (as Viral_DI_counts_8seg_UMI_counting_v2.py) for each segment, and export the gapped alignments with unique UMIs in sam files, in a single pass over each sam file.')
+
+parser.add_argument(
+    '--gtf_file', required=True, help='gtf file')
+
+parser.add_argument(
+    '--input_sam_file', help='input sam file, or a sam container of all cells when --cell is given')
+
+parser.add_argument(
+    '--cell', help='the cell to read from the sam container given as --input_sam_file')
+
+parser.add_argument(
+    '--output_sam_file', help='output sam file of the gapped alignments')
+
+parser.add_argument(
+    '--all_counts_file', help='count file of all the UMIs (e.g., "all_UMI_counts.txt")')
+
+parser.add_argument(
+    '--gapped_counts_file', help='count file of the gapped UMIs (e.g., "gapped_rcounts.txt")')
+
+parser.add_argument(
+    '--input_sam_files', nargs='+', help='input sam files of many cells, counted in one run (batch mode, in place of --input_sam_file)')
+
+parser.add_argument(
+    '--container', help='a sam container of all cells with its cell offset index (written by separate_sc-sam-alignment_10Xoutput.py --container), whose cells are counted in one run (batch mode)')
+
+parser.add_argument(
+    '--cells', nargs='+', help='the cells to read from --container (default: all)')
+
+parser.add_argument(
+    '--output_dir', help='the directory for the output files of each cell (batch mode): <cell>.sam with the gapped alignments, <cell>_gapped_rcounts.txt and <cell>_all_UMI_counts.txt with the UMI counts')
+
+parser.add_argument(
+    '--all_matrix', help='a csv file of all the UMI counts of all cells, one column per cell (batch mode)')
+
+parser.add_argument(
+    '--gapped_matrix', help='a csv file of the gapped UMI counts of all cells, one column per cell (batch mode)')
+
+parser.add_argument(
+    '-j', '--jobs', type=int, default=1, help='the number of worker processes counting cells in parallel (batch mode, default: 1)')
+
+parser.add_argument(
+    '--cb_list', help='cell barcode list; if given, only alignments whose CB tag is in the list are counted')
+
+parser.add_argument(
+    '--cache_dir', default=DEFAULT_CACHE_DIR, help='the directory of the result cache, which keeps the results of each input by its content and the parameters so unchanged inputs are skipped on re-runs (default: %s)' % DEFAULT_CACHE_DIR)
+
+parser.add_argument(
+    '--cache_size', type=int, default=DEFAULT_CACHE_SIZE >> 20, help='the maximum size of the result cache in MB, beyond which the least recently used results are removed (default: %d)' % (DEFAULT_CACHE_SIZE >> 20))
+
+parser.add_argument(
+    '--no_cache', '--no-cache', action='store_true', help='neither read nor write the result cache')
+
+args = parser.parse_args()
+
+
+def main():
+    batch = args.input_sam_files is not None or args.container is not None
+    if batch == (args.input_sam_file is not None):
+        parser.error('Give either --input_sam_file, or --input_sam_files and/or --container.')
+    if batch and args.output_dir is None and args.all_matrix is None and args.gapped_matrix is None:
+        parser.error('The batch mode needs --output_dir and/or --all_matrix and/or --gapped_matrix.')
+    if not batch and None in (args.output_sam_file, args.all_counts_file, args.gapped_counts_file):
+        parser.error('--input_sam_file needs --output_sam_file, --all_counts_file and --gapped_counts_file.')
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1.')
+
+    cache = make_result_cache(args.cache_dir, args.cache_size << 20, args.no_cache)
+    if batch:
+        try:
+            inputs = cell_inputs(args.input_sam_files or [], args.container, args.cells)
+        except ValueError as e:
+            parser.error(str(e))
+        run_umi_counting(inputs, args.gtf_file, ['sam', 'all_counts', 'gapped_counts'], args.output_dir,
+                         {'all_counts': args.all_matrix, 'gapped_counts': args.gapped_matrix}, args.cb_list,
+                         args.jobs, cache)
+        return
+
+    input_sam_file = args.input_sam_file
+    if args.cell is not None:
+        try:
+            input_sam_file = read_cell(args.input_sam_file, args.cell)
+        except ValueError as e:
+            parser.error(str(e))
+    count_sam_file(input_sam_file, args.gtf_file,
+                   {'sam': args.output_sam_file, 'all_counts': args.all_counts_file,
+                    'gapped_counts': args.gapped_counts_file}, args.cb_list, cache)
+
+
+if __name__ == '__main__':
+    main()
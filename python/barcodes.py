@@ -0,0 +1,84 @@
+BASES = 'ACGTN'
+
+
+def split_suffix(barcode):
+    """Split a cell ranger barcode such as 'AAACCTGAGAAGGCCT-1' into its sequence and GEM suffix."""
+    i = barcode.find('-')
+    if i < 0:
+        return barcode, ''
+    return barcode[:i], barcode[i:]
+
+
+def hamming1_neighbors(barcode):
+    """All sequences at Hamming distance 1 from the barcode sequence (including N), suffix kept."""
+    seq, suffix = split_suffix(barcode)
+    for i, base in enumerate(seq):
+        for sub in BASES:
+            if sub != base:
+                yield seq[:i] + sub + seq[i + 1:] + suffix
+
+
+class BarcodeIndex(object):
+    """A cell barcode whitelist with constant-time membership and optional one-mismatch correction.
+
+    The CB tags of cell ranger are already corrected against its full whitelist, so a CB
+    barcode is only matched exactly: one a mismatch away from a listed cell is another
+    valid barcode. With correct=True, a record without a CB tag is assigned by its raw CR
+    sequence instead, through a table mapping every listed sequence and each of its
+    Hamming-1 neighbours back to the listed barcode; sequences shared by two or more
+    listed barcodes are ambiguous and left uncorrected.
+    """
+
+    def __init__(self, barcodes, correct=False):
+        self.barcodes = list(barcodes)
+        self._exact = frozenset(self.barcodes)
+        self._sequences = None
+        self._neighbors = None
+        self.correct = correct
+        self.corrected = 0
+        if correct:
+            self._sequences, self._neighbors = self._build_neighbors()
+
+    @classmethod
+    def from_file(cls, path, correct=False):
+        with open(path) as f:
+            return cls([l.rstrip() for l in f if l.strip()], correct=correct)
+
+    def _build_neighbors(self):
+        sequences = {}
+        for barcode in self.barcodes:
+            seq = split_suffix(barcode)[0]
+            sequences[seq] = None if seq in sequences else barcode
+        neighbors = {}
+        for barcode in self.barcodes:
+            for neighbor in hamming1_neighbors(split_suffix(barcode)[0]):
+                if neighbor not in sequences:
+                    neighbors[neighbor] = None if neighbor in neighbors else barcode
+        return (dict((k, v) for k, v in sequences.items() if v is not None),
+                dict((k, v) for k, v in neighbors.items() if v is not None))
+
+    def __contains__(self, barcode):
+        return barcode in self._exact
+
+    def __iter__(self):
+        return iter(self.barcodes)
+
+    def __len__(self):
+        return len(self.barcodes)
+
+    def lookup(self, barcode, raw=None):
+        """Return the listed barcode of a record with the CB barcode, or with the raw CR sequence if it has none, or None.
+
+        The raw sequence is only used with correct=True, matched to the listed barcode of the
+        same sequence or of its unique one-mismatch correction.
+        """
+        if barcode is not None:
+            return barcode if barcode in self._exact else None
+        if self._sequences is None or raw is None:
+            return None
+        listed = self._sequences.get(raw)
+        if listed is None:
+            listed = self._neighbors.get(raw)
+            if listed is not None:
+                self.corrected += 1
+        return listed
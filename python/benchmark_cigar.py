@@ -0,0 +1,80 @@
+import re
+import timeit
+import argparse
+
+from cigar import CIGAR_CACHE, extract_align_info, parse_cigar
+
+
+parser = argparse.ArgumentParser('Micro-benchmark the per-read cost of cigar parsing: the extract_align_info formerly copied into each script against parse_cigar of the shared cigar module, and the cost of extract_align_info with the cigar cache (mostly cache hits on repeated cigars) reported separately.')
+
+parser.add_argument(
+    '-n', '--number', type=int, default=100000, help='the number of reads parsed per timing (default: 100000)')
+parser.add_argument(
+    '-r', '--repeat', type=int, default=3, help='the number of timings per cigar, the best one is reported (default: 3)')
+
+args = parser.parse_args()
+
+UPPERCASE = re.compile(r'([A-Z])')
+
+CIGARS = [
+    '91M',
+    '98M',
+    '10S81M',
+    '30M1200N61M',
+    '5S20M2D15M1200N40M',
+    '25M1I10M1500N30M2S',
+    '12M1I20M2D15M1100N20M3D20M'
+]
+
+
+def legacy_extract_align_info(split_line):
+    sposition1 = int(split_line[3])
+    cigar = {'cha': [], 'len': []}
+    last = None
+    for i, s in enumerate(re.split(UPPERCASE, split_line[5])):
+        if s:
+            if i % 2 == 0:
+                last = int(s)
+            else:
+                cigar['cha'].append(s)
+                cigar['len'].append(last)
+    return sposition1, cigar
+
+
+def legacy_parse(split_line):
+    sposition1, cigar = legacy_extract_align_info(split_line)
+    return ''.join(cigar['cha'])
+
+
+def shared_parse(split_line):
+    # the start is still converted, as extract_align_info does, to time the same work
+    _, cigar = int(split_line[3]), parse_cigar(split_line[5])
+    return cigar.pattern
+
+
+def cached_parse(split_line):
+    sposition1, cigar = extract_align_info(split_line)
+    return cigar.pattern
+
+
+def per_read_us(func, split_line):
+    # the cigar cache is emptied before each timing, so only its first read of a timing is a miss
+    timings = timeit.repeat(lambda: func(split_line), setup=CIGAR_CACHE.clear, number=args.number,
+                            repeat=args.repeat)
+    return min(timings) / args.number * 1e6
+
+
+def main():
+    print('\t'.join(['cigar', 'legacy_us_per_read', 'shared_us_per_read', 'speedup', 'cached_us_per_read',
+                     'cached_speedup']))
+    for cigar in CIGARS:
+        split_line = ['read', '0', 'AF389115.1', '100', '255', cigar, '*', '0', '0', '*', '*']
+        legacy = per_read_us(legacy_parse, split_line)
+        shared = per_read_us(shared_parse, split_line)
+        cached = per_read_us(cached_parse, split_line)
+        print('%s\t%.3f\t%.3f\t%.2fx\t%.3f\t%.2fx' % (cigar, legacy, shared, legacy / shared, cached,
+                                                     legacy / cached))
+
+
+if __name__ == '__main__':
+    main()
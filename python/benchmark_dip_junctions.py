@@ -0,0 +1,86 @@
+import random
+import timeit
+import argparse
+
+import numpy as np
+
+from dip_junctions import KERNELS, compile_dip_patterns, find_junctions, read_batches
+from segments import PR8_POLYMERASE_REGISTRY
+
+
+parser = argparse.ArgumentParser('Benchmark the DIP junction kernels (pure Python walk, NumPy, and numba when installed) on a synthetic cell.')
+
+parser.add_argument(
+    '-n', '--reads', type=int, default=1000000, help='the number of reads of the synthetic cell (default: 1000000)')
+parser.add_argument(
+    '-g', '--gapped', type=float, default=0.2, help='the fraction of gapped reads (default: 0.2)')
+parser.add_argument(
+    '-r', '--repeat', type=int, default=3, help='the number of timings per kernel, the best one is reported (default: 3)')
+parser.add_argument(
+    '--seed', type=int, default=1, help='the random seed of the synthetic reads (default: 1)')
+
+args = parser.parse_args()
+
+PATTERNS = compile_dip_patterns(['MNM', 'SMNM', 'MNMS', 'SMNMS', 'MDMNM', 'MIMNM', 'MNMDMS', 'SMNMIM'])
+
+UNGAPPED = ['91M', '10S81M', '81M10S', '40M1D51M', '40M1I50M']
+
+
+def synthetic_cigar(pattern, rng):
+    lens = []
+    for op in pattern:
+        if op == 'N':
+            lens.append(rng.randint(100, 2000))
+        elif op == 'M':
+            lens.append(rng.randint(5, 60))
+        else:
+            lens.append(rng.randint(1, 5))
+    return ''.join('%d%s' % (n, op) for n, op in zip(lens, pattern))
+
+
+def synthetic_cell(reads, gapped, seed):
+    rng = random.Random(seed)
+    patterns = sorted(PATTERNS)
+    segments = PR8_POLYMERASE_REGISTRY.names
+    lines = []
+    for i in range(reads):
+        if rng.random() < gapped:
+            cigar = synthetic_cigar(rng.choice(patterns), rng)
+        else:
+            cigar = rng.choice(UNGAPPED)
+        lines.append('\t'.join(['read%d' % i, '0', rng.choice(segments), str(rng.randint(1, 2000)), '255', cigar,
+                                '*', '0', '0', '*', '*']) + '\n')
+    return lines
+
+
+def run_kernel(batches, kernel):
+    return [find_junctions(batch, 10, 500, kernel) for batch in batches]
+
+
+def main():
+    lines = synthetic_cell(args.reads, args.gapped, args.seed)
+    start = timeit.default_timer()
+    batches = list(read_batches(lines, PR8_POLYMERASE_REGISTRY.ids, PATTERNS))
+    packing = timeit.default_timer() - start
+    packed = sum(len(batch) for batch in batches)
+    print('reads=%d\tgapped_packed=%d\tpacking_s=%.3f' % (args.reads, packed, packing))
+
+    expected = None
+    timings = {}
+    for kernel in sorted(KERNELS):
+        result = run_kernel(batches, kernel)  # also compiles the numba kernel before timing
+        columns = [np.concatenate(column) for column in zip(*result)]
+        if expected is None:
+            expected = columns
+        elif not all(np.array_equal(a, b) for a, b in zip(expected, columns)):
+            raise AssertionError('Kernel %s disagrees with the others.' % kernel)
+        timings[kernel] = min(timeit.repeat(lambda: run_kernel(batches, kernel), number=1, repeat=args.repeat))
+
+    print('\t'.join(['kernel', 'seconds', 'reads_per_s', 'speedup_vs_python']))
+    for kernel in sorted(timings, key=timings.get, reverse=True):
+        print('%s\t%.4f\t%.0f\t%.1fx' % (kernel, timings[kernel], args.reads / timings[kernel],
+                                          timings['python'] / timings[kernel]))
+
+
+if __name__ == '__main__':
+    main()
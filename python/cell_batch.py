@@ -0,0 +1,57 @@
+import os
+import multiprocessing
+
+import pandas as pd
+
+_worker = {}
+
+
+def _init_worker(function, params):
+    _worker['function'] = function
+    _worker['params'] = params
+
+
+def _run_in_worker(input_):
+    return _worker['function'](input_, **_worker['params'])
+
+
+def map_cells(function, inputs, jobs=1, **params):
+    """Yield function(input_, **params) for each input in input order, from a pool of worker processes if jobs > 1.
+
+    The function and the params are sent to each worker once, so they are read (e.g. the
+    gtf) and set up in the main process only; the function has to be a module-level one.
+    """
+    if jobs < 2:
+        for input_ in inputs:
+            yield function(input_, **params)
+        return
+    pool = multiprocessing.Pool(jobs, _init_worker, (function, params))
+    try:
+        for result in pool.imap(_run_in_worker, inputs, chunksize=4):
+            yield result
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def cell_id(file_):
+    return os.path.basename(file_).split('.')[0]
+
+
+def write_count_matrix(counts, path):
+    """Write the per-segment counts of many cells as one csv table, a seg column followed by a column per cell.
+
+    counts is a sequence of (cell, {segment: count}); the table is the same as the one
+    extract_alignment_UMI_counts_per-cell.py summarizes from the per-cell count files.
+    """
+    cells = []
+    columns = {}
+    for cid, seg_counts in counts:
+        cells.append(cid)
+        columns[cid] = pd.Series(seg_counts)
+    matrix = pd.DataFrame(columns, columns=cells)
+    matrix.index.name = 'seg'
+    matrix.reset_index().to_csv(path, index=False)
@@ -0,0 +1,197 @@
+import os
+import sys
+import collections
+
+INDEX_SUFFIX = '.cidx'
+HEADER_KEY = '@'
+
+
+def index_path(path):
+    return path + INDEX_SUFFIX
+
+
+class ContainerPool(object):
+    """Write the alignments of all cells to one sam container plus a cell offset index.
+
+    The container starts with the header lines, followed by blocks of alignments, each
+    block belonging to one cell. The index (<container>.cidx) has one tab-separated line
+    per block: cell barcode, byte offset and byte length. Used in place of a HandlePool,
+    so a cell's blocks are as large as the CellWriter buffers allow.
+    """
+
+    def __init__(self, path, headers):
+        self.path = path
+        self.headers = headers
+        self._f = None
+        self._index = None
+        self._created = set()
+        self.opens = 0
+        self.reopens = 0
+        self.evictions = 0
+
+    def _open(self):
+        if os.path.exists(self.path):
+            raise ValueError('Output container already exists.')
+        self._f = open(self.path, 'wb')
+        self._index = open(index_path(self.path), 'w')
+        self.opens += 1
+        self._write(HEADER_KEY, self.headers)
+
+    def _write(self, key, lines):
+        offset = self._f.tell()
+        self._f.write(''.join(lines).encode())
+        self._index.write('%s\t%d\t%d\n' % (key, offset, self._f.tell() - offset))
+
+    def write_block(self, key, lines):
+        if self._f is None:
+            self._open()
+        self._write(key, lines)
+        self._created.add(key)
+
+    def keys(self):
+        return self._created
+
+    def close(self):
+        if self._f is None:
+            self._open()
+        self._f.close()
+        self._index.close()
+
+
+class CellContainer(object):
+    """Read a sam container written by ContainerPool, seeking straight to the blocks of a cell."""
+
+    def __init__(self, path):
+        self.path = path
+        self.blocks = collections.OrderedDict()
+        with open(index_path(path)) as f:
+            for l in f:
+                key, offset, length = l.rstrip('\n').split('\t')
+                self.blocks.setdefault(key, []).append((int(offset), int(length)))
+        self._headers = self.blocks.pop(HEADER_KEY)
+        self._f = open(path, 'rb')
+
+    @property
+    def cells(self):
+        return list(self.blocks)
+
+    def read_blocks(self, blocks):
+        for offset, length in blocks:
+            self._f.seek(offset)
+            yield self._f.read(length)
+
+    def read_lines(self, blocks):
+        for block in self.read_blocks(blocks):
+            for l in block.decode().splitlines(True):
+                yield l
+
+    def cell_blocks(self, cid):
+        """The (offset, length) byte ranges of a cell in the container, its headers first."""
+        if cid not in self.blocks:
+            raise KeyError('Cell %s is not in container %s.' % (cid, self.path))
+        return self._headers + self.blocks[cid]
+
+    def open_cell(self, cid):
+        """Return the lines (headers first) of a cell as a file-like object."""
+        return CellFile(self, self.cell_blocks(cid))
+
+    def close(self):
+        self._f.close()
+
+
+class CellFile(object):
+    def __init__(self, container, blocks):
+        self._lines = container.read_lines(blocks)
+
+    def __iter__(self):
+        return self._lines
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._lines.close()
+
+
+class CellRef(str):
+    """An input file name standing for one cell of a container.
+
+    It reads as '<container dir>/<cell>.sam', so the scripts derive the cell id from it
+    as they do from a per-cell sam file; open_input seeks into the container instead.
+    """
+
+    def __new__(cls, container, cid):
+        ref = str.__new__(cls, os.path.join(os.path.dirname(container.path), '%s.sam' % cid))
+        ref.container = container
+        ref.cid = cid
+        return ref
+
+    def __reduce__(self):
+        # sent to a worker process as the container path and cell id, so the worker reads its own index
+        return read_cell, (self.container.path, self.cid)
+
+
+class StandardStream(object):
+    """Use stdin or stdout in a with statement without closing it."""
+
+    def __init__(self, f):
+        self.f = f
+
+    def __enter__(self):
+        return self.f
+
+    def __exit__(self, *exc):
+        self.f.flush()
+
+
+def open_input(file_):
+    if isinstance(file_, CellRef):
+        return file_.container.open_cell(file_.cid)
+    if file_ == '-':
+        return StandardStream(sys.stdin)
+    return open(file_)
+
+
+def open_output(path, buffer_size=1 << 20):
+    if path == '-':
+        return StandardStream(sys.stdout)
+    return open(path, 'w', buffer_size)
+
+
+def check_cells(container, cells):
+    """Raise a ValueError naming the cells that are not in the container."""
+    missing = [cid for cid in cells if cid not in container.blocks]
+    if missing:
+        raise ValueError('Cells not in container %s: %s.' % (container.path, ', '.join(missing)))
+
+
+def cell_inputs(files, container=None, cells=None):
+    """The inputs of a per-cell script: the given sam files, then the selected cells of a container (all by default).
+
+    Raises a ValueError if a selected cell is not in the container.
+    """
+    inputs = list(files)
+    if container is not None:
+        container = CellContainer(container)
+        if cells:
+            check_cells(container, cells)
+        inputs.extend(CellRef(container, cid) for cid in (cells or container.cells))
+    return inputs
+
+
+_containers = {}
+
+
+def read_cell(path, cid):
+    """A CellRef to a cell of the container at path; the container index is read once per process.
+
+    Raises a ValueError if the cell is not in the container.
+    """
+    container = _containers.get(path)
+    if container is None:
+        container = _containers[path] = CellContainer(path)
+    check_cells(container, [cid])
+    return CellRef(container, cid)
@@ -0,0 +1,59 @@
+import random
+import argparse
+
+import numpy as np
+
+from dip_junctions import BoundaryHistogram
+
+
+parser = argparse.ArgumentParser('Check the percentiles of the DIP boundary histogram against np.percentile of the same positions on random junctions; its interpolation follows the numpy version installed, so run this after upgrading numpy.')
+
+parser.add_argument(
+    '-n', '--cases', type=int, default=3000, help='the number of random segments checked (default: 3000)')
+parser.add_argument(
+    '--seed', type=int, default=1, help='the random seed of the junctions (default: 1)')
+
+args = parser.parse_args()
+
+SEGMENT_LENGTH = 2400
+
+
+def random_positions(rng):
+    # few and many junctions, spread over the segment or piled up on a few positions
+    n = rng.choice([1, 2, 3, rng.randint(4, 50), rng.randint(50, 5000)])
+    low = rng.randint(1, SEGMENT_LENGTH - 1)
+    high = rng.choice([low, min(low + rng.randint(1, 10), SEGMENT_LENGTH), SEGMENT_LENGTH])
+    return np.array([rng.randint(low, high) for _ in range(n)], dtype=np.int64)
+
+
+def random_percentiles(rng):
+    # the range ends of the extractors' -p percentile, then arbitrary ones
+    p = rng.randint(0, 100)
+    return [float(100 - p) / 2, float(100 - p) / 2 + p, rng.uniform(0, 100), 0.0, 100.0]
+
+
+def main():
+    rng = random.Random(args.seed)
+    mismatches = 0
+    checked = 0
+    for case in range(args.cases):
+        boundary5 = random_positions(rng)
+        boundary3 = random_positions(rng)[:len(boundary5)]
+        boundary5 = boundary5[:len(boundary3)]
+        histogram = BoundaryHistogram(1, SEGMENT_LENGTH + 2)
+        histogram.add(np.zeros(len(boundary5), dtype=np.int32), boundary5, boundary3)
+        for end, positions in enumerate((boundary5, boundary3)):
+            for q in random_percentiles(rng):
+                expected = float(np.percentile(positions, q))
+                found = histogram.percentile(0, end, q)
+                checked += 1
+                if found != expected or int(found) != int(expected):
+                    mismatches += 1
+                    print('case %d end %d q=%r: histogram %r, np.percentile %r' % (case, end, q, found, expected))
+    print('numpy=%s\tpercentiles=%d\tmismatches=%d' % (np.__version__, checked, mismatches))
+    if mismatches:
+        raise AssertionError('The boundary histogram disagrees with np.percentile.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+import re
+from itertools import compress
+
+OPS = re.compile(r'([MIDNSHP=XB])')
+
+# cigar operations consuming the reference
+REF_OPS = frozenset('MDN=X')
+ALL_OPS = frozenset('MIDNSHP=XB')
+
+# pattern -> which of its operations consume the reference
+_REF_MASKS = {}
+
+
+class Cigar(object):
+    """A parsed cigar string.
+
+    pattern is the string of operation codes (e.g. 'SMNM'), lens the tuple of their
+    lengths and ref_span the number of reference bases covered by the alignment.
+    junctions holds, for each skipped region (N), the offsets from the alignment start
+    of the last reference base before it and of the first one after it.
+    """
+
+    __slots__ = ('pattern', 'lens', 'ref_span', 'junctions')
+
+    def __init__(self, pattern, lens, ref_span, junctions=()):
+        self.pattern = pattern
+        self.lens = lens
+        self.ref_span = ref_span
+        self.junctions = junctions
+
+    def __repr__(self):
+        return 'Cigar(%r, %r)' % (self.pattern, self.lens)
+
+
+def ref_mask(pattern):
+    mask = _REF_MASKS.get(pattern)
+    if mask is None:
+        mask = _REF_MASKS[pattern] = tuple([op in REF_OPS for op in pattern])
+    return mask
+
+
+def find_junctions(pattern, lens):
+    junctions = []
+    consumed = 0
+    for op, n in zip(pattern, lens):
+        if op == 'N':
+            junctions.append((consumed - 1, consumed + n))
+        if op in REF_OPS:
+            consumed += n
+    return tuple(junctions)
+
+
+def parse_cigar(cigar_string):
+    # '5S20M1200N40M' -> ['5', 'S', '20', 'M', '1200', 'N', '40', 'M', '']
+    parts = OPS.split(cigar_string)
+    pattern = ''.join(parts[1::2])
+    lens = tuple(map(int, parts[:-1:2]))
+    junctions = find_junctions(pattern, lens) if 'N' in pattern else ()
+    return Cigar(pattern, lens, sum(compress(lens, ref_mask(pattern))), junctions)
+
+
+class CigarCache(object):
+    """A bounded cache of parsed cigars keyed by the cigar string.
+
+    Entries live in two generations of at most maxsize each: hits in the older one are
+    promoted to the current one, and when the current one is full the older one is
+    dropped. This evicts the least recently used cigars at the cost of two dict lookups.
+    """
+
+    def __init__(self, maxsize=65536):
+        self.maxsize = maxsize
+        self._current = {}
+        self._old = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, cigar_string):
+        cigar = self._current.get(cigar_string)
+        if cigar is not None:
+            self.hits += 1
+            return cigar
+        cigar = self._old.get(cigar_string)
+        if cigar is not None:
+            self.hits += 1
+        else:
+            cigar = parse_cigar(cigar_string)
+            self.misses += 1
+        if len(self._current) >= self.maxsize:
+            self._old = self._current
+            self._current = {}
+        self._current[cigar_string] = cigar
+        return cigar
+
+    def __len__(self):
+        return len(self._current) + len(self._old)
+
+    def clear(self):
+        self._current = {}
+        self._old = {}
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return 'cigar cache: %d hits, %d misses, %d entries' % (self.hits, self.misses, len(self))
+
+
+CIGAR_CACHE = CigarCache()
+
+
+def decode_cigar(cigar_string):
+    return CIGAR_CACHE.get(cigar_string)
+
+
+def extract_align_info(split_line):
+    sposition1 = int(split_line[3])
+    cigar = CIGAR_CACHE.get(split_line[5])
+    return sposition1, cigar
+
+
+def ref_end(sposition1, cigar):
+    """The last reference base covered by an alignment starting at sposition1 (both 1-based)."""
+    return sposition1 + cigar.ref_span - 1
+
+
+def compile_patterns(patterns):
+    """Check a whitelist of cigar patterns and freeze it for constant-time lookup."""
+    for pattern in patterns:
+        if not pattern or set(pattern) - ALL_OPS:
+            raise ValueError('Invalid cigar pattern: %r' % pattern)
+    return frozenset(patterns)
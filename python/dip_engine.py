@@ -0,0 +1,234 @@
+import os
+import collections
+
+import numpy as np
+import pandas as pd
+
+from cell_batch import map_cells
+from cell_container import open_input
+from cigar import CIGAR_CACHE
+from dip_junctions import BoundaryHistogram, collect_junctions, compile_dip_patterns, empty_bounds, filter_junctions
+from result_cache import cached
+from segments import PR8_POLYMERASE_REGISTRY
+from split_coverage import average_coverage, read_split_coverage
+
+CELL_PATTERNS = compile_dip_patterns([
+    'MNM', 'SMNM', 'MNMS', 'MNMDM', 'SMNMS', 'MDMNM', 'MNMIM', 'MIMNM', 'SMDMNM', 'MNMDMS',
+    'SMNMDM', 'SMNMIM', 'SMIMNM', 'MDMNMS', 'MIMNMS', 'MNMIMS', 'MDMIMNM', 'SMDMNMS', 'SMNMIMS',
+    'SMIMNMS', 'MDMDMNM', 'MNMIMIM', 'SMNMDMS', 'MNMDMDM', 'MNMDMIM', 'MIMDMNM', 'MIMIMNM',
+    'MNMIMDM', 'MDMNMIMS', 'SMIMNMDM', 'MIMNMIM', 'MDMNMIM', 'MIMNMDM', 'MDMNMDM'])
+BULK_PATTERNS = compile_dip_patterns(CELL_PATTERNS | frozenset(['MNMDMDMS', 'SMDMDMNM', 'MDMDMNMS']))
+
+OUTPUT_FORMATS = ('csv', 'parquet', 'feather')
+
+# cell: 10X per-cell sam files; bulk: per-sample sam files of bulk RNA-seq or virus stock sequencing,
+# whose samples without any junction still get one 'na' pair per segment in the output tables
+MODES = {
+    'cell': {'patterns': CELL_PATTERNS, 'mark_empty': False},
+    'bulk': {'patterns': BULK_PATTERNS, 'mark_empty': True},
+}
+
+
+def record_dip_boundary(file_, min_length, skip_length, patterns, registry=PR8_POLYMERASE_REGISTRY, with_umis=True,
+                        histogram=None):
+    """The (segment ids, boundary5, boundary3, umis) arrays of the candidate junctions of a sam file, read in a single pass.
+
+    The junctions are also counted into histogram, if given.
+    """
+    with open_input(file_) as f:
+        return collect_junctions(f, registry.ids, patterns, min_length, skip_length, with_umis=with_umis,
+                                 histogram=histogram)
+
+
+def generate_info_table(histogram, percentile, registry=PR8_POLYMERASE_REGISTRY):
+    percentile1 = float(100 - percentile) / 2
+    percentile2 = float(100 - percentile) / 2 + percentile
+    bounds = empty_bounds(len(registry))
+
+    info_table = {'segment': [], 'boundary5_range5': [], 'boundary5_range3': [], 'boundary3_range5': [],
+                  'boundary3_range3': []}
+    for segment, key in enumerate(registry.names):
+        if histogram.total(segment) == 0:
+            continue
+        boundary5_range_5 = histogram.percentile(segment, 0, percentile1)
+        boundary5_range_3 = histogram.percentile(segment, 0, percentile2)
+        boundary3_range_5 = histogram.percentile(segment, 1, percentile1)
+        boundary3_range_3 = histogram.percentile(segment, 1, percentile2)
+        info_table['segment'].append(key)
+        info_table['boundary5_range5'].append(boundary5_range_5)
+        info_table['boundary5_range3'].append(boundary5_range_3)
+        info_table['boundary3_range5'].append(boundary3_range_5)
+        info_table['boundary3_range3'].append(boundary3_range_3)
+        # the range limits, truncated to integer positions, of the segment id for filtering the junctions
+        bounds[segment] = [int(boundary5_range_5), int(boundary5_range_3),
+                           int(boundary3_range_5), int(boundary3_range_3)]
+    return pd.DataFrame(info_table), bounds
+
+
+def sample_name(file_):
+    return os.path.basename(file_).split('.')[0]
+
+
+def find_dip_boundary(file_, min_length, skip_length, percentile, mode='cell', registry=PR8_POLYMERASE_REGISTRY,
+                      with_umis=True):
+    """The DIP junctions of one cell or sample, as {segment: [[boundary5, boundary3, umi], ...]}, umi None unless with_umis."""
+    settings = MODES[mode]
+    histogram = BoundaryHistogram(len(registry), registry.max_length() + 2)
+    junctions = record_dip_boundary(file_, min_length, skip_length, settings['patterns'], registry, with_umis,
+                                    histogram)
+    info_table, bounds = generate_info_table(histogram, percentile, registry)
+    boundary = dict((segment, []) for segment in registry)
+    if not info_table.empty:
+        # the candidate junctions kept from the single pass over the file are filtered in memory
+        segments, boundary5, boundary3, umis = filter_junctions(junctions, bounds)
+        umis = umis.tolist() if umis is not None else [None] * len(segments)
+        for segment, b5, b3, umi in zip(segments.tolist(), boundary5.tolist(), boundary3.tolist(), umis):
+            boundary[registry.names[segment]].append([b5, b3, umi])
+    elif settings['mark_empty']:
+        for segment in registry:
+            boundary[segment] = [[np.nan, np.nan, None]]
+    return boundary
+
+
+def extract_dip_boundary(file_, min_length, skip_length, percentile, mode='cell', registry=PR8_POLYMERASE_REGISTRY,
+                         cache=None, with_umis=True):
+    """Extract the DIP junctions of one cell or sample, as (name, {segment: [[boundary5, boundary3, umi], ...]}).
+
+    The UMIs are only read with_umis, umi is None otherwise. With a ResultCache, the
+    junctions of an input whose content and parameters were seen before are read from
+    the cache instead.
+    """
+    params = {'min_length': min_length, 'skip_length': skip_length, 'percentile': percentile, 'mode': mode,
+              'segments': tuple(registry.names), 'lengths': tuple(registry.lengths.tolist()), 'with_umis': with_umis}
+    boundary = cached(cache, 'dip_boundary', file_, params,
+                      lambda: find_dip_boundary(file_, min_length, skip_length, percentile, mode, registry, with_umis))
+    return sample_name(file_), boundary
+
+
+def map_inputs(inputs, jobs=1, **params):
+    """Yield the results of extract_dip_boundary in input order, from a pool of worker processes if jobs > 1."""
+    return map_cells(extract_dip_boundary, inputs, jobs, **params)
+
+
+def calculate_ave_cov_from_bed(cov_file):
+    coverage = pd.read_csv(cov_file, sep='\t', names=['segment', 'position', 'coverage'])
+    ave_cov = (coverage.groupby('segment')['coverage'].sum() / coverage.groupby('segment').size()).to_dict()
+    return ave_cov
+
+
+def bed_cov_file(cov_dir, file_):
+    return os.path.join(cov_dir, '.'.join((sample_name(file_), 'PR8virus.bed_genomecov.txt')))
+
+
+def sample_coverage(file_, cov_dir=None, cov_bams=None):
+    """The average coverage of each segment of a sample, from its alignments in cov_bams if given, else its bed genomecov file."""
+    if cov_bams is not None:
+        return average_coverage(read_split_coverage(cov_bams[sample_name(file_)]))
+    return calculate_ave_cov_from_bed(bed_cov_file(cov_dir, file_))
+
+
+def write_boundary_tables(segment_boundary, output_dir):
+    """Write the boundary5 and boundary3 tables of each segment, one row per cell or sample padded with 'na'."""
+    boundary5_all = {}
+    boundary3_all = {}
+    for seg in segment_boundary:
+        for name in segment_boundary[seg]:
+            boundary5_all[name] = pd.Series([iterm[0] for iterm in segment_boundary[seg][name]])
+            boundary3_all[name] = pd.Series([iterm[1] for iterm in segment_boundary[seg][name]])
+        boundary5_all_df = pd.DataFrame(boundary5_all).transpose().fillna('na')
+        boundary3_all_df = pd.DataFrame(boundary3_all).transpose().fillna('na')
+        boundary5_all_df.to_csv(os.path.join(output_dir, '_'.join((seg, 'boundary_5prime-end.csv'))))
+        boundary3_all_df.to_csv(os.path.join(output_dir, '_'.join((seg, 'boundary_3prime-end.csv'))))
+
+
+def long_boundary_table(segment_boundary, names, registry=PR8_POLYMERASE_REGISTRY):
+    """One row per DIP junction with its cell (or sample), segment, boundary5, boundary3 and UMI.
+
+    The cell, segment and UMI columns are categorical (dictionary-encoded). Cells and
+    samples without any junction have no row.
+    """
+    names = list(collections.OrderedDict.fromkeys(names))
+    table = {'cell': [], 'segment': [], 'boundary5': [], 'boundary3': [], 'umi': []}
+    for name in names:
+        for segment in registry:
+            for b5, b3, umi in segment_boundary[segment].get(name, []):
+                if not pd.isnull(b5):
+                    table['cell'].append(name)
+                    table['segment'].append(segment)
+                    table['boundary5'].append(b5)
+                    table['boundary3'].append(b3)
+                    table['umi'].append(umi)
+    return pd.DataFrame({
+        'cell': pd.Categorical(table['cell'], categories=names),
+        'segment': pd.Categorical(table['segment'], categories=registry.names),
+        'boundary5': np.array(table['boundary5'], dtype=np.int32),
+        'boundary3': np.array(table['boundary3'], dtype=np.int32),
+        'umi': pd.Categorical(table['umi']),
+    }, columns=['cell', 'segment', 'boundary5', 'boundary3', 'umi'])
+
+
+def check_output_format(output_format):
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError('Unknown output format %r, expected one of: %s.' % (output_format, ', '.join(OUTPUT_FORMATS)))
+    if output_format != 'csv':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError('Writing %s output needs pyarrow.' % output_format)
+
+
+def write_long_table(table, output_dir, output_format):
+    path = os.path.join(output_dir, '.'.join(('DIP_boundaries', output_format)))
+    if output_format == 'parquet':
+        table.to_parquet(path, index=False)
+    else:
+        table.to_feather(path)
+    return path
+
+
+def run_dip_extraction(inputs, output_dir, min_length, skip_length, percentile, mode='cell', cov_dir=None, jobs=1,
+                       output_format='csv', registry=PR8_POLYMERASE_REGISTRY, cache=None, cov_bams=None):
+    """Extract the DIP junctions of the registry segments in all the inputs and write the boundaries to output_dir.
+
+    With the csv format, a boundary5 and a boundary3 table is written per segment with one
+    row per cell or sample; with parquet or feather, a single long table of all junctions
+    (DIP_boundaries.<format>, see long_boundary_table). In bulk mode the average coverage
+    of each sample is written to ave_coverage_per-sample.csv, computed from its bam file
+    among cov_bams (matched by sample name) or else read from its bed genomecov file
+    in cov_dir. The UMIs of the junctions are only read for the long table. The
+    junctions of each input are kept in the cache, if given, so unchanged inputs are not
+    parsed again on re-runs.
+    """
+    if mode not in MODES:
+        raise ValueError('Unknown mode %r, expected one of: %s.' % (mode, ', '.join(sorted(MODES))))
+    if mode == 'bulk' and cov_dir is None and cov_bams is None:
+        raise ValueError('The bulk mode needs the bam files or the directory of the bed genomecov files.')
+    if mode == 'bulk' and cov_bams is not None:
+        cov_bams = dict((sample_name(path), path) for path in cov_bams)
+        missing = [sample_name(file_) for file_ in inputs if sample_name(file_) not in cov_bams]
+        if missing:
+            raise ValueError('No bam file for the coverage of samples: %s.' % ', '.join(missing))
+    check_output_format(output_format)
+    cov_df = {}
+    names = []
+    segment_boundary = dict((segment, {}) for segment in registry)
+    results = map_inputs(inputs, jobs, min_length=min_length, skip_length=skip_length, percentile=percentile,
+                         mode=mode, registry=registry, cache=cache, with_umis=output_format != 'csv')
+    for i, (name, boundary) in enumerate(results):
+        print('Processing file: ' + inputs[i])
+        if mode == 'bulk':
+            cov_df[name] = sample_coverage(inputs[i], cov_dir, cov_bams)
+        names.append(name)
+        for segment in boundary:
+            segment_boundary[segment][name] = boundary[segment]
+    if mode == 'bulk':
+        pd.DataFrame(cov_df).to_csv(os.path.join(output_dir, 'ave_coverage_per-sample.csv'))
+    if output_format == 'csv':
+        write_boundary_tables(segment_boundary, output_dir)
+    else:
+        write_long_table(long_boundary_table(segment_boundary, names, registry), output_dir, output_format)
+    if jobs == 1:
+        # the worker processes each have their own cache
+        print(CIGAR_CACHE.stats())
+        if cache is not None:
+            print(cache.stats())
@@ -0,0 +1,277 @@
+import re
+import itertools
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+from cigar import extract_align_info, compile_patterns
+
+# cigar operation codes of the packed arrays; 0 pads the cigars shorter than the longest one of a batch
+OP_CODES = dict((op, i + 1) for i, op in enumerate('MIDNSHP=XB'))
+M = OP_CODES['M']
+N = OP_CODES['N']
+REF_CODES = [OP_CODES[op] for op in 'MDN=X']
+IS_REF = np.zeros(len(OP_CODES) + 1, dtype=np.bool_)
+IS_REF[REF_CODES] = True
+
+BATCH_SIZE = 1 << 16
+
+UB = re.compile(r'(?<=\tUB:Z:)[^\t\n]+')
+
+
+def compile_dip_patterns(patterns):
+    """Check a whitelist of gapped cigar patterns; each must have exactly one skipped region (N)."""
+    for pattern in patterns:
+        if pattern.count('N') != 1:
+            raise ValueError('DIP cigar pattern %r must have exactly one skipped region.' % pattern)
+    return compile_patterns(patterns)
+
+
+class RecordBatch(object):
+    """Alignments packed into NumPy columns.
+
+    segments holds the segment id, positions the 1-based start and umis the UMI (UB tag,
+    None if missing) of each alignment, or is None when the UMIs are not read; codes and lens are (alignments x operations)
+    arrays of the cigar operation codes and lengths, padded with zeros up to the longest
+    cigar of the batch.
+    """
+
+    def __init__(self, segments, positions, codes, lens, umis):
+        self.segments = segments
+        self.positions = positions
+        self.codes = codes
+        self.lens = lens
+        self.umis = umis
+
+    def __len__(self):
+        return len(self.positions)
+
+
+def pack_records(segments, positions, cigars, umis):
+    pattern_ids = {}
+    rows = np.array([pattern_ids.setdefault(c.pattern, len(pattern_ids)) for c in cigars], dtype=np.intp)
+    patterns = sorted(pattern_ids, key=pattern_ids.get)
+    width = max(len(p) for p in patterns)
+    table = np.zeros((len(patterns), width), dtype=np.uint8)
+    for i, pattern in enumerate(patterns):
+        table[i, :len(pattern)] = [OP_CODES[op] for op in pattern]
+    codes = table[rows]
+    lens = np.zeros(codes.shape, dtype=np.int64)
+    # boolean assignment fills the operations row by row, in cigar order
+    lens[codes > 0] = np.fromiter(itertools.chain.from_iterable(c.lens for c in cigars), dtype=np.int64)
+    if umis is not None:
+        umis = np.array(umis, dtype=object)
+    return RecordBatch(np.array(segments, dtype=np.intp), np.array(positions, dtype=np.int64), codes, lens, umis)
+
+
+def read_batches(lines, segment_ids, patterns, batch_size=BATCH_SIZE, with_umis=True):
+    """Pack the alignments on the given segments (name -> id) whose cigar pattern is whitelisted into RecordBatches.
+
+    The UB tags are only searched for with_umis; otherwise the umis of the batches are None.
+    """
+    segments, positions, cigars = [], [], []
+    umis = [] if with_umis else None
+    for line in lines:
+        if not line.startswith('@'):
+            split_line = line.split('\t', 6)
+            segment = segment_ids.get(split_line[2])
+            if segment is not None:
+                sposition1, cigar = extract_align_info(split_line)
+                if cigar.pattern in patterns:
+                    segments.append(segment)
+                    positions.append(sposition1)
+                    cigars.append(cigar)
+                    if with_umis:
+                        umi = UB.search(line)
+                        umis.append(umi.group() if umi is not None else None)
+                    if len(cigars) == batch_size:
+                        yield pack_records(segments, positions, cigars, umis)
+                        segments, positions, cigars = [], [], []
+                        umis = [] if with_umis else None
+    if cigars:
+        yield pack_records(segments, positions, cigars, umis)
+
+
+def numpy_junction_columns(batch):
+    """The boundary5, boundary3, skip, flank5 and flank3 columns of a batch, computed with array operations."""
+    codes, lens = batch.codes, batch.lens
+    rows = np.arange(len(batch))
+    n_col = (codes == N).argmax(axis=1)
+    skip = lens[rows, n_col]
+    ref_lens = np.where(IS_REF[codes], lens, 0)
+    ref_before = ref_lens.cumsum(axis=1)[rows, n_col] - skip
+    m_lens = np.where(codes == M, lens, 0)
+    flank5 = np.where(np.arange(codes.shape[1]) < n_col[:, None], m_lens, 0).sum(axis=1)
+    flank3 = m_lens.sum(axis=1) - flank5
+    boundary5 = batch.positions + ref_before - 1
+    return boundary5, boundary5 + 1 + skip, skip, flank5, flank3
+
+
+def walk_junctions(codes, lens, positions, is_ref):
+    """The junction columns of packed cigars, walking each cigar once; compiled by numba when it is installed."""
+    n_reads, width = codes.shape
+    boundary5 = np.zeros(n_reads, dtype=np.int64)
+    boundary3 = np.zeros(n_reads, dtype=np.int64)
+    skip = np.zeros(n_reads, dtype=np.int64)
+    flank5 = np.zeros(n_reads, dtype=np.int64)
+    flank3 = np.zeros(n_reads, dtype=np.int64)
+    for i in range(n_reads):
+        consumed = 0
+        after_skip = False
+        for j in range(width):
+            op = codes[i, j]
+            if op == 0:
+                break
+            length = lens[i, j]
+            if op == N:
+                boundary5[i] = positions[i] + consumed - 1
+                boundary3[i] = positions[i] + consumed + length
+                skip[i] = length
+                after_skip = True
+            elif op == M:
+                if after_skip:
+                    flank3[i] += length
+                else:
+                    flank5[i] += length
+            if is_ref[op]:
+                consumed += length
+    return boundary5, boundary3, skip, flank5, flank3
+
+
+def python_junction_columns(batch):
+    return walk_junctions(batch.codes, batch.lens, batch.positions, IS_REF)
+
+
+KERNELS = {'numpy': numpy_junction_columns, 'python': python_junction_columns}
+
+if numba is not None:
+    _jit_walk_junctions = numba.njit(cache=True, nogil=True)(walk_junctions)
+
+    def numba_junction_columns(batch):
+        return _jit_walk_junctions(batch.codes, batch.lens, batch.positions, IS_REF)
+
+    KERNELS['numba'] = numba_junction_columns
+
+# the numba kernel when numba is installed, else the NumPy one
+DEFAULT_KERNEL = 'numba' if numba is not None else 'numpy'
+
+
+def find_junctions(batch, min_length, skip_length, kernel=DEFAULT_KERNEL):
+    """The (segment ids, boundary5, boundary3, umis) arrays of the alignments of a batch passing the DIP filters.
+
+    umis is None when the batch was read without its UMIs.
+
+    boundary5 is the last reference base before the skipped region and boundary3 the
+    first one after it. An alignment passes if the matches (M) on each side of the
+    skipped region add up to at least min_length and the region is at least skip_length long.
+    kernel names the implementation of KERNELS computing the junction columns.
+    """
+    boundary5, boundary3, skip, flank5, flank3 = KERNELS[kernel](batch)
+    keep = (flank5 >= min_length) & (flank3 >= min_length) & (skip >= skip_length)
+    umis = batch.umis[keep] if batch.umis is not None else None
+    return batch.segments[keep], boundary5[keep], boundary3[keep], umis
+
+
+def iter_junctions(lines, segment_ids, patterns, min_length, skip_length, batch_size=BATCH_SIZE,
+                   kernel=DEFAULT_KERNEL, with_umis=True):
+    for batch in read_batches(lines, segment_ids, patterns, batch_size, with_umis):
+        yield find_junctions(batch, min_length, skip_length, kernel)
+
+
+def collect_junctions(lines, segment_ids, patterns, min_length, skip_length, batch_size=BATCH_SIZE,
+                      kernel=DEFAULT_KERNEL, with_umis=True, histogram=None):
+    """The (segment ids, boundary5, boundary3, umis) arrays of all the junctions passing the DIP filters in one pass.
+
+    The segment ids and boundaries are int32 and umis is None unless with_umis. The
+    junctions of each batch are added to the BoundaryHistogram histogram, if given, as
+    they are read.
+    """
+    columns = []
+    for segments, boundary5, boundary3, umis in iter_junctions(lines, segment_ids, patterns, min_length, skip_length,
+                                                                batch_size, kernel, with_umis):
+        if histogram is not None:
+            histogram.add(segments, boundary5, boundary3)
+        columns.append((segments.astype(np.int32), boundary5.astype(np.int32), boundary3.astype(np.int32), umis))
+    if not columns:
+        return (np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32),
+                np.zeros(0, dtype=object) if with_umis else None)
+    return tuple(np.concatenate(column) if column[0] is not None else None for column in zip(*columns))
+
+
+def empty_bounds(n_segments):
+    """A segment-id indexed array of the boundary5 and boundary3 range limits, all ranges empty.
+
+    Each row holds boundary5_range5, boundary5_range3, boundary3_range5 and boundary3_range3.
+    """
+    bounds = np.zeros((n_segments, 4), dtype=np.int64)
+    bounds[:, 0::2] = 1
+    return bounds
+
+
+def filter_junctions(junctions, bounds):
+    """Keep the junctions whose boundary5 and boundary3 both lie in the ranges of their segment."""
+    segments, boundary5, boundary3 = junctions[:3]
+    limits = bounds[segments]
+    keep = ((limits[:, 0] <= boundary5) & (boundary5 <= limits[:, 1]) &
+            (limits[:, 2] <= boundary3) & (boundary3 <= limits[:, 3]))
+    return tuple(column[keep] if column is not None else None for column in junctions)
+
+
+# np.percentile interpolates with a weighted sum before numpy 1.22 and with a symmetric lerp since;
+# repeating the same floating point operations gives the same range limits once truncated to ints
+WEIGHTED_PERCENTILE = tuple(int(v) for v in np.__version__.split('.')[:2]) < (1, 22)
+
+
+def lerp(a, b, t):
+    if WEIGHTED_PERCENTILE:
+        return a * (1.0 - t) + b * t
+    if a == b:
+        return float(a)
+    if t >= 0.5:
+        return b - (b - a) * (1 - t)
+    return a + (b - a) * t
+
+
+class BoundaryHistogram(object):
+    """Counts of the boundary5 and boundary3 positions of the junctions of each segment.
+
+    Percentiles are computed exactly from the cumulative counts, the same values as
+    np.percentile of the positions (checked by check_boundary_percentiles.py), without
+    sorting them. The histogram takes memory proportional to the segment lengths, but
+    the candidate junctions are still held until their ranges are known, so the memory
+    of a cell grows with its number of junctions.
+    """
+
+    def __init__(self, n_segments, length=0):
+        self.counts = np.zeros((n_segments, 2, length), dtype=np.int64)
+
+    def _grow(self, length):
+        if length > self.counts.shape[2]:
+            counts = np.zeros(self.counts.shape[:2] + (length,), dtype=np.int64)
+            counts[:, :, :self.counts.shape[2]] = self.counts
+            self.counts = counts
+
+    def add(self, segments, boundary5, boundary3):
+        if len(segments):
+            self._grow(int(max(boundary5.max(), boundary3.max())) + 1)
+        n_segments, _, length = self.counts.shape
+        for end, positions in enumerate((boundary5, boundary3)):
+            cells = np.bincount(segments.astype(np.intp) * length + positions, minlength=n_segments * length)
+            self.counts[:, end] += cells.reshape(n_segments, length)
+
+    def total(self, segment):
+        return int(self.counts[segment, 0].sum())
+
+    def percentile(self, segment, end, q):
+        """np.percentile(positions, q) of the boundary5 (end 0) or boundary3 (end 1) positions of a segment."""
+        cumulative = self.counts[segment, end].cumsum()
+        index = q / 100.0 * (cumulative[-1] - 1)
+        below = int(np.floor(index))
+        above = min(below + 1, int(cumulative[-1]) - 1)
+        # the k-th smallest position (from 0) is the first one whose cumulative count exceeds k
+        a, b = np.searchsorted(cumulative, [below, above], side='right')
+        return lerp(int(a), int(b), index - below)
@@ -0,0 +1,66 @@
+import argparse
+
+from cell_container import cell_inputs
+from result_cache import DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE, make_result_cache
+from segments import select_segments
+from dip_engine import MODES, OUTPUT_FORMATS, run_dip_extraction
+
+parser = argparse.ArgumentParser('Extract the junction coordinates of defective interferring particles for each polymerase segment from sam files, per cell for 10X data (--mode cell) or per sample for bulk RNA-seq and virus stock data (--mode bulk). Note: the given boundaries are corresponding to the last base at the 3prime end of the first proportion of the gapped reads and the 5prime end of the last proportion of the gapped reads.')
+
+parser.add_argument(
+    'files', nargs='*', help='input sam file for each cell or sample')
+parser.add_argument(
+    '--mode', choices=sorted(MODES), default='cell', help='cell: 10X per-cell sam files; bulk: per-sample sam files, with their average coverage (default: cell)')
+parser.add_argument(
+    '-cd', '--cov_dir', help='the directory containing corresponding bed genomecov files for individual samples (bulk mode)')
+parser.add_argument(
+    '-cb', '--cov_bam', nargs='+', help='the bam file of each sample (named <sample>.*.bam) to compute the average coverage from directly, in place of --cov_dir (bulk mode, needs pysam)')
+parser.add_argument(
+    '-g', '--reference_genome', help='the reference genome in fasta format; if given, the junctions of all its segments are extracted (default: the PR8 polymerase segments AF389115.1, AF389116.1 and AF389117.1)')
+parser.add_argument(
+    '--segments', nargs='+', help='the segments to extract the junctions of (default: all the segments of --reference_genome)')
+parser.add_argument(
+    '-m', '--min_length', required=True, type=int, help='the minimum length of parts of reads mapped to 5 and 3 end separately')
+parser.add_argument(
+    '-sl', '--skip_length', required=True, type=int, help='the minimum length of the skip region in cigar')
+parser.add_argument(
+    '-p', '--percentile', required=True, type=int, help='the percentile of boundary range to cover in determining DIP (e.g. 95 or 100)')
+parser.add_argument(
+    '-od', '--output_dir', required=True, help='the directory for all the output files')
+parser.add_argument(
+    '--output_format', choices=OUTPUT_FORMATS, default='csv', help='csv: a boundary5 and a boundary3 table per segment, one row per cell or sample; parquet or feather: one long table of all junctions with their cell, segment, boundaries and UMI (needs pyarrow) (default: csv)')
+parser.add_argument(
+    '--container', help='a sam container of all cells with its cell offset index (written by separate_sc-sam-alignment_10Xoutput.py --container), read in addition to the input files')
+parser.add_argument(
+    '--cells', nargs='+', help='the cells to read from the container (default: all)')
+parser.add_argument(
+    '-j', '--jobs', type=int, default=1, help='the number of worker processes extracting cells or samples in parallel (default: 1)')
+parser.add_argument(
+    '--cache_dir', default=DEFAULT_CACHE_DIR, help='the directory of the result cache, which keeps the results of each input by its content and the parameters so unchanged inputs are skipped on re-runs (default: %s)' % DEFAULT_CACHE_DIR)
+parser.add_argument(
+    '--cache_size', type=int, default=DEFAULT_CACHE_SIZE >> 20, help='the maximum size of the result cache in MB, beyond which the least recently used results are removed (default: %d)' % (DEFAULT_CACHE_SIZE >> 20))
+parser.add_argument(
+    '--no_cache', '--no-cache', action='store_true', help='neither read nor write the result cache')
+
+args = parser.parse_args()
+
+
+def main():
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1.')
+    try:
+        inputs = cell_inputs(args.files, args.container, args.cells)
+    except ValueError as e:
+        parser.error(str(e))
+    if not inputs:
+        parser.error('no input sam files')
+    if args.mode == 'bulk' and (args.cov_dir is None) == (args.cov_bam is None):
+        parser.error('--mode bulk needs one of --cov_dir and --cov_bam.')
+    run_dip_extraction(inputs, args.output_dir, args.min_length, args.skip_length, args.percentile, mode=args.mode,
+                       cov_dir=args.cov_dir, cov_bams=args.cov_bam, jobs=args.jobs, output_format=args.output_format,
+                       registry=select_segments(args.reference_genome, segments=args.segments),
+                       cache=make_result_cache(args.cache_dir, args.cache_size << 20, args.no_cache))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,24 +2,37 @@ import os
 import argparse
 import pandas as pd
 
+from barcodes import BarcodeIndex, split_suffix
+
 parser = argparse.ArgumentParser('Extract # of the UMI counts of gapped alignments for each cell.')
 
 parser.add_argument(
     'inputs', nargs='+', help='input count txt file for each cell')
 parser.add_argument(
     '-o', '--output', required=True, help='the output file')
+parser.add_argument(
+    '-l', '--cb_list', help='cell barcode list (e.g. barcodes.tsv); if given, only the cells in the list are summarized, matched by barcode sequence so that count files named with or without the GEM suffix (-1) both match')
 
 args = parser.parse_args()
 
 
 def main():
-    for i, input_ in enumerate(args.inputs):
+    cbl = None
+    if args.cb_list is not None:
+        # filter_IAV_sam.py names the cells without the GEM suffix, the container path keeps it
+        cbl = frozenset(split_suffix(barcode)[0] for barcode in BarcodeIndex.from_file(args.cb_list))
+    df = None
+    for input_ in args.inputs:
         cid = os.path.basename(input_).split('_')[0]
-        if i == 0:
+        if cbl is not None and split_suffix(cid)[0] not in cbl:
+            continue
+        if df is None:
             df = pd.read_csv(input_, sep='\t', names=['seg', cid])
         else:
             new = pd.read_csv(input_, sep='\t', names=['seg', cid])
             df = pd.merge(df, new, on='seg', how='outer')
+    if df is None:
+        parser.error('no input cell is in the cell barcode list')
     df.to_csv(args.output, index=False)
 
 
@@ -1,6 +1,8 @@
 import argparse
 import os
-import re
+import sys
+
+from cigar import decode_cigar, CIGAR_CACHE
 
 parser = argparse.ArgumentParser('Extract the patterns in cigar string for each IAV sam file in a directory.')
 
@@ -12,19 +14,19 @@ parser.add_argument(
 args = parser.parse_args()
 
 
-DIGIT = re.compile('\d+')
-
 patterns = {}
 
 for fn in os.listdir(args.input_dir):
     with open(fn) as f:
         for line in f:
             if not line.startswith('@'):
-                pattern = DIGIT.sub('^', line.split()[5])
+                pattern = decode_cigar(line.split()[5]).pattern
                 if pattern in patterns:
                     patterns[pattern] += 1
                 else:
                     patterns[pattern] = 1
 
 with open(args.output, 'a') as f:
-    f.write('\n'.join(['%s\t%i' % (k, v) for k, v in patterns.iteritems()]))
+    f.write('\n'.join(['%s\t%i' % (''.join('^' + op for op in k), v) for k, v in patterns.iteritems()]))
+
+sys.stderr.write(CIGAR_CACHE.stats() + '\n')
@@ -2,42 +2,64 @@ import os
 import argparse
 import pandas as pd
 
+from segments import select_segments
+
 # argument parser
-parser = argparse.ArgumentParser('Extract the peak position in the bed-genomecov output for 3 polymerase segments in PR8.')
+parser = argparse.ArgumentParser('Extract the peak position at the 3prime end in the bed-genomecov output for each segment, by default the 3 polymerase segments in PR8.')
 
 parser.add_argument(
     'files', nargs='+', help='input bed genomecov file for each cell')
 parser.add_argument(
     '-o', '--output', required=True, help='the output csv file name')
+parser.add_argument(
+    '-g', '--reference_genome', help='the reference genome in fasta format; if given, the peaks of all its segments are extracted (default: the PR8 polymerase segments AF389115.1, AF389116.1 and AF389117.1)')
+parser.add_argument(
+    '--segments', nargs='+', help='the segments to extract the peaks of (default: all the segments of --reference_genome)')
+parser.add_argument(
+    '--peak_start', type=int, default=1000, help='the peak is searched after this position of each segment, which has to be in the first half of the segment (default: 1000, the 3prime end region of the PR8 polymerase segments)')
+parser.add_argument(
+    '--peak_start_fraction', type=float, help='if given, the peak is searched after this fraction of the length of each segment (e.g. 0.43), in place of --peak_start')
 
 args = parser.parse_args()
 
 
+def peak_starts(registry):
+    """The position of each segment id after which its peak is searched."""
+    starts = []
+    for name, length in zip(registry.names, registry.lengths.tolist()):
+        if length == 0:
+            parser.error('The length of segment %s is unknown, give its reference with -g.' % name)
+        if args.peak_start_fraction is not None:
+            starts.append(int(args.peak_start_fraction * length))
+        elif args.peak_start >= length / 2:
+            parser.error('--peak_start %d leaves less than half of segment %s (%d nt) to search, use --peak_start_fraction.'
+                         % (args.peak_start, name, length))
+        else:
+            starts.append(args.peak_start)
+    return starts
+
+
 def main():
+    if args.peak_start_fraction is not None and not 0 <= args.peak_start_fraction < 1:
+        parser.error('--peak_start_fraction must be at least 0 and below 1.')
+    registry = select_segments(args.reference_genome, segments=args.segments)
+    starts = peak_starts(registry)
     peaks = {}
     for file_ in args.files:
         cid = os.path.basename(file_).split('.')[0]
-        cov = {'AF389115.1': 0, 'AF389116.1': 0, 'AF389117.1': 0}
-        pb2_max_cov = 0
-        pb1_max_cov = 0
-        pa_max_cov = 0
+        # the peak position and its coverage of each segment id
+        peak = [0] * len(registry)
+        max_cov = [0] * len(registry)
         with open(file_) as f:
             for l in f:
-                segment = l.split('\t')[0]
-                if int(l.split('\t')[1]) > 1000:
-                    if segment == 'AF389115.1':
-                        if int(l.split('\t')[2].split('\n')[0]) > pb2_max_cov:
-                            pb2_max_cov = int(l.split('\t')[2].split('\n')[0])
-                            cov['AF389115.1'] = l.split('\t')[1]
-                    elif segment == 'AF389116.1':
-                        if int(l.split('\t')[2].split('\n')[0]) > pb1_max_cov:
-                            pb1_max_cov = int(l.split('\t')[2].split('\n')[0])
-                            cov['AF389116.1'] = l.split('\t')[1]
-                    elif segment == 'AF389117.1':
-                        if int(l.split('\t')[2].split('\n')[0]) > pa_max_cov:
-                            pa_max_cov = int(l.split('\t')[2].split('\n')[0])
-                            cov['AF389117.1'] = l.split('\t')[1]
-        peaks[cid] = cov
+                split_line = l.split('\t')
+                segment = registry.ids.get(split_line[0])
+                if segment is not None and int(split_line[1]) > starts[segment]:
+                    coverage = int(split_line[2].split('\n')[0])
+                    if coverage > max_cov[segment]:
+                        max_cov[segment] = coverage
+                        peak[segment] = split_line[1]
+        peaks[cid] = dict(zip(registry.names, peak))
     peaks_df = pd.DataFrame(peaks)
     peaks_df.to_csv(args.output)
 
@@ -1,55 +1,64 @@
 import os
 import argparse
 
+from cell_container import cell_inputs, open_input, open_output
+from sam_filters import read_fasta_ids
+
 
 # argument parser
 parser = argparse.ArgumentParser('Extract reads mapped to IAV reference genomes.')
 
 parser.add_argument(
-    'files', nargs='+', help='input sam file for each cell')
+    'files', nargs='*', help='input sam file for each cell ("-" for stdin)')
 parser.add_argument(
     '-g', '--reference_genome', required=True, help='IAV reference genomes in fasta format')
 parser.add_argument(
-    '-od', '--output_dir', required=True, help='the directory for all the output files')
+    '-od', '--output_dir', required=True, help='the directory for all the output files ("-" for stdout)')
+parser.add_argument(
+    '--container', help='a sam container of all cells with its cell offset index (written by separate_sc-sam-alignment_10Xoutput.py --container), read in addition to the input files')
+parser.add_argument(
+    '--cells', nargs='+', help='the cells to read from the container (default: all)')
 
 args = parser.parse_args()
 
 
-def read_fasta_ids(path):
-    ids = set()
-    with open(path) as f:
-        for l in f:
-            if l.startswith('>'):
-                seqid = l.split(' ')[0][1:]
-                ids.add(seqid)
-    return ids
+def output_path(output_dir, cid):
+    if output_dir == '-':
+        return '-'
+    return os.path.join(output_dir, '%s.sam' % cid)
 
 
-def process_file(file_, fasta_ids):
-    headers = []
-    data = []
-    with open(file_) as f:
-        cid = os.path.basename(file_).split('-')[0]
+def process_file(file_, fasta_ids, output_dir):
+    cid = os.path.basename(file_).split('-')[0]
+    with open_input(file_) as f, open_output(output_path(output_dir, cid)) as out:
         for l in f:
             if l.startswith('@HD'):
-                headers.append(l)
+                out.write(l)
             elif l.startswith('@SQ'):
                 if l.split('\t')[1][3:] in fasta_ids:
-                    headers.append(l)
+                    out.write(l)
             elif l.startswith('@PG'):
-                headers.append(l)
+                out.write(l)
             elif not l.startswith('@'):
                 if l.split('\t')[2] in fasta_ids:
-                    data.append(l)
-    return headers, data, cid
+                    out.write(l)
+    return cid
 
 
 def main():
+    try:
+        files = cell_inputs(args.files, args.container, args.cells)
+    except ValueError as e:
+        parser.error(str(e))
+    if not files:
+        parser.error('no input sam files')
+    if '-' in files and args.output_dir != '-':
+        parser.error('sam read from stdin must be written to stdout (-od -)')
+    if args.output_dir == '-' and len(files) > 1:
+        parser.error('only one input sam file can be written to stdout')
     ids = read_fasta_ids(args.reference_genome)
-    for file_ in args.files:
-        headers, data, cid = process_file(file_, ids)
-        with open(os.path.join(args.output_dir, '%s.sam' % cid), 'w') as f:
-            f.writelines(headers + data)
+    for file_ in files:
+        process_file(file_, ids, args.output_dir)
 
 
 if __name__ == '__main__':
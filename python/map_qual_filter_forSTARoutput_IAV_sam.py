@@ -1,37 +1,55 @@
 import os
 import argparse
 
+from cell_container import cell_inputs, open_input, open_output
+
 
 # argument parser
 parser = argparse.ArgumentParser('Fill IAV sam files from STAR output to exclude multi-mapper (MAPQ != 255).')
 
 parser.add_argument(
-    'files', nargs='+', help='input sam file for each cell')
+    'files', nargs='*', help='input sam file for each cell ("-" for stdin)')
+parser.add_argument(
+    '-od', '--output_dir', required=True, help='the directory for all the output files ("-" for stdout)')
+parser.add_argument(
+    '--container', help='a sam container of all cells with its cell offset index (written by separate_sc-sam-alignment_10Xoutput.py --container), read in addition to the input files')
 parser.add_argument(
-    '-od', '--output_dir', required=True, help='the directory for all the output files')
+    '--cells', nargs='+', help='the cells to read from the container (default: all)')
 
 args = parser.parse_args()
 
 
-def process_file(file_):
-    headers = []
-    data = []
-    with open(file_) as f:
-        cid = os.path.basename(file_).split('.')[0]
+def output_path(output_dir, cid):
+    if output_dir == '-':
+        return '-'
+    return os.path.join(output_dir, '%s.sam' % cid)
+
+
+def process_file(file_, output_dir):
+    cid = os.path.basename(file_).split('.')[0]
+    with open_input(file_) as f, open_output(output_path(output_dir, cid)) as out:
         for l in f:
             if l.startswith('@'):
-                headers.append(l)
+                out.write(l)
             else:
-                if l.split('\t')[4] == '255':
-                    data.append(l)
-    return headers, data, cid
+                if l.split('\t', 5)[4] == '255':
+                    out.write(l)
+    return cid
 
 
 def main():
-    for file_ in args.files:
-        headers, data, cid = process_file(file_)
-        with open(os.path.join(args.output_dir, '%s.sam' % cid), 'w') as f:
-            f.writelines(headers + data)
+    try:
+        files = cell_inputs(args.files, args.container, args.cells)
+    except ValueError as e:
+        parser.error(str(e))
+    if not files:
+        parser.error('no input sam files')
+    if '-' in files and args.output_dir != '-':
+        parser.error('sam read from stdin must be written to stdout (-od -)')
+    if args.output_dir == '-' and len(files) > 1:
+        parser.error('only one input sam file can be written to stdout')
+    for file_ in files:
+        process_file(file_, args.output_dir)
 
 
 if __name__ == '__main__':
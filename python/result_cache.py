@@ -0,0 +1,182 @@
+import os
+import sys
+import pickle
+import time
+import hashlib
+import tempfile
+
+from cell_container import CellRef
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'iav_dvg_results')
+DEFAULT_CACHE_SIZE = 1 << 30
+CACHE_SUFFIX = '.pkl'
+TMP_SUFFIX = '.tmp'
+STALE_TMP_AGE = 3600
+
+# part of every key; bump it when a cached analysis changes its results for the same input and parameters
+CACHE_VERSION = 2
+
+CHUNK_SIZE = 1 << 20
+
+
+def file_digest(path):
+    """The sha1 hex digest of the content of a file."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def input_digest(file_):
+    """The sha1 hex digest of the content of an input sam file or container cell, None for stdin."""
+    if file_ == '-':
+        return None
+    if not isinstance(file_, CellRef):
+        return file_digest(file_)
+    # the raw bytes of the cell's blocks, the same digest as a sam file of the cell
+    container = file_.container
+    digest = hashlib.sha1()
+    for block in container.read_blocks(container.cell_blocks(file_.cid)):
+        digest.update(block)
+    return digest.hexdigest()
+
+
+class ResultCache(object):
+    """Per-input results stored on disk, keyed by the content of the input and the parameters of the analysis.
+
+    Each result is pickled to <directory>/<key>.pkl, written to a temporary file first so
+    that concurrent workers never read a partial entry. Entries are touched when read and
+    the least recently used ones are removed once the directory exceeds max_size bytes.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_size=DEFAULT_CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self._size = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disabled = False
+
+    def __getstate__(self):
+        # a worker process starts with its own counters and size estimate
+        return {'directory': self.directory, 'max_size': self.max_size}
+
+    def __setstate__(self, state):
+        self.__init__(state['directory'], state['max_size'])
+
+    def key(self, namespace, file_, params):
+        """The key of the result of analysis namespace on an input with params, None if the input cannot be hashed."""
+        digest = input_digest(file_)
+        if digest is None:
+            return None
+        key = hashlib.sha1()
+        key.update(repr((CACHE_VERSION, sys.version_info[0], namespace, digest, sorted(params.items()))).encode())
+        return key.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + CACHE_SUFFIX)
+
+    def get(self, key):
+        """The stored result of a key, or None."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                result = pickle.load(f)
+            os.utime(path, None)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        """Store a result; on any write error the cache is disabled with a warning, the analysis goes on."""
+        if self.disabled:
+            return
+        tmp = None
+        try:
+            if not os.path.isdir(self.directory):
+                try:
+                    os.makedirs(self.directory)
+                except OSError:
+                    if not os.path.isdir(self.directory):
+                        raise
+            fd, tmp = tempfile.mkstemp(suffix=TMP_SUFFIX, dir=self.directory)
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(result, f, 2)
+            size = os.path.getsize(tmp)
+            os.rename(tmp, self._path(key))
+            tmp = None
+            if self._size is None:
+                self._size = sum(size for path, size, mtime in self._entries())
+            else:
+                self._size += size
+            if self._size > self.max_size:
+                self.evict()
+        except (IOError, OSError) as e:
+            self.disable(e)
+        finally:
+            if tmp is not None:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+
+    def disable(self, error):
+        if not self.disabled:
+            sys.stderr.write('Warning: result cache %s disabled: %s\n' % (self.directory, error))
+        self.disabled = True
+
+    def _entries(self):
+        # the entries, plus the temporary files left behind by killed runs once they are old
+        # enough not to be in the middle of a write
+        entries = []
+        stale = time.time() - STALE_TMP_AGE
+        for name in os.listdir(self.directory):
+            if name.endswith(CACHE_SUFFIX) or name.endswith(TMP_SUFFIX):
+                path = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if name.endswith(CACHE_SUFFIX) or st.st_mtime < stale:
+                    entries.append((path, st.st_size, st.st_mtime))
+        return entries
+
+    def evict(self):
+        """Remove the least recently used entries until the cache is down to 90% of max_size."""
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        self._size = sum(size for path, size, mtime in entries)
+        for path, size, mtime in entries:
+            if self._size <= self.max_size * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self._size -= size
+            self.evictions += 1
+
+    def stats(self):
+        return 'result cache: %d hits, %d misses, %d evictions' % (self.hits, self.misses, self.evictions)
+
+
+def make_result_cache(cache_dir=DEFAULT_CACHE_DIR, cache_size=DEFAULT_CACHE_SIZE, no_cache=False):
+    """The result cache of the command line options, None with --no_cache."""
+    if no_cache:
+        return None
+    return ResultCache(cache_dir, cache_size)
+
+
+def cached(cache, namespace, file_, params, compute):
+    """The result of compute() for an input, from the cache when it holds one for the same content and params."""
+    key = cache.key(namespace, file_, params) if cache is not None and not cache.disabled else None
+    if key is None:
+        return compute()
+    result = cache.get(key)
+    if result is None:
+        result = compute()
+        cache.put(key, result)
+    return result
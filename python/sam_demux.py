@@ -0,0 +1,290 @@
+import os
+import sys
+import shutil
+import itertools
+import collections
+import multiprocessing
+
+from sam_filters import FilterChain
+
+
+NO_FILTERS = FilterChain()
+
+
+class HandlePool(object):
+    """A bounded pool of open output files, evicting the least recently used one when full.
+
+    The first time a key is opened its file is created and the header lines are written;
+    later opens (after an eviction) append to the same file.
+    """
+
+    def __init__(self, path_for, headers, max_open=512):
+        if max_open < 1:
+            raise ValueError('max_open must be at least 1.')
+        self.path_for = path_for
+        self.headers = headers
+        self.max_open = max_open
+        self._handles = collections.OrderedDict()
+        self._created = set()
+        self.opens = 0
+        self.reopens = 0
+        self.evictions = 0
+
+    def get(self, key):
+        f = self._handles.pop(key, None)
+        if f is None:
+            if len(self._handles) >= self.max_open:
+                _, oldest = self._handles.popitem(last=False)
+                oldest.close()
+                self.evictions += 1
+            if key in self._created:
+                f = open(self.path_for(key), 'a')
+                self.reopens += 1
+            else:
+                f = open(self.path_for(key), 'w')
+                f.writelines(self.headers)
+                self._created.add(key)
+            self.opens += 1
+        self._handles[key] = f
+        return f
+
+    def write_block(self, key, lines):
+        self.get(key).writelines(lines)
+
+    def keys(self):
+        return self._created
+
+    def close(self):
+        while self._handles:
+            _, f = self._handles.popitem(last=False)
+            f.close()
+
+
+class CellWriter(object):
+    """Buffer lines per cell and write them out in blocks through a HandlePool (or a ContainerPool).
+
+    A cell is flushed when its own buffer reaches block_size bytes; when the buffers of
+    all cells together exceed buffer_size bytes, the largest ones are flushed until the
+    total drops to half of it.
+    """
+
+    def __init__(self, pool, block_size=1 << 18, buffer_size=1 << 28):
+        self.pool = pool
+        self.block_size = block_size
+        self.buffer_size = buffer_size
+        self._buffers = {}
+        self._sizes = collections.defaultdict(int)
+        self._total = 0
+        self.records = 0
+        self.flushes = 0
+
+    def write(self, key, line):
+        buf = self._buffers.get(key)
+        if buf is None:
+            buf = self._buffers[key] = []
+        buf.append(line)
+        size = self._sizes[key] + len(line)
+        self._sizes[key] = size
+        self._total += len(line)
+        self.records += 1
+        if size >= self.block_size:
+            self.flush(key)
+        elif self._total >= self.buffer_size:
+            self.flush_largest()
+
+    def flush(self, key):
+        buf = self._buffers.pop(key, None)
+        if buf:
+            self.pool.write_block(key, buf)
+            self._total -= self._sizes.pop(key)
+            self.flushes += 1
+
+    def flush_largest(self):
+        for key in sorted(self._sizes, key=self._sizes.get, reverse=True):
+            if self._total <= self.buffer_size // 2:
+                break
+            self.flush(key)
+
+    def close(self):
+        for key in sorted(self._buffers):
+            self.flush(key)
+        self.pool.close()
+
+    def stats(self):
+        return collections.OrderedDict([
+            ('records', self.records),
+            ('cells', len(self.pool.keys())),
+            ('flushes', self.flushes),
+            ('opens', self.pool.opens),
+            ('reopens', self.pool.reopens),
+            ('evictions', self.pool.evictions),
+        ])
+
+
+def report_stats(stats, stream=sys.stderr):
+    stream.write('\t'.join('%s=%s' % (k, v) for k, v in stats.items()) + '\n')
+
+
+def make_output_dir(output_dir):
+    if os.path.exists(output_dir):
+        raise ValueError('Output directory already exists.')
+    else:
+        os.makedirs(output_dir)
+
+
+def cell_sam_path(output_dir):
+    return lambda cid: os.path.join(output_dir, '%s.sam' % cid)
+
+
+def is_kept_header(line):
+    return line.startswith('@HD') or line.startswith('@SQ')
+
+
+def extract_tag(split_line, tag):
+    """A string tag of the tab-split fields of a sam line, found as in the counters so it agrees with the bam record."""
+    prefix = tag + ':Z:'
+    for s in split_line:
+        if s.startswith(prefix):
+            return s[5:].rstrip()
+
+
+def sam_cell_records(f, headers, chain=NO_FILTERS, raw=False):
+    """Yield (cell barcode, raw barcode, line) for the alignments of a text sam file that pass the filter chain.
+
+    The cell barcode is the CB tag; with raw=True, the alignments without one are yielded
+    with their uncorrected CR tag as the raw barcode (None otherwise). The @HD and @SQ
+    lines kept by the chain are appended to headers as they are read.
+    """
+    for l in f:
+        if l.startswith('@'):
+            if is_kept_header(l) and chain.keep_header(l):
+                headers.append(l)
+        elif chain.accepts(l):
+            split_line = l.split('\t')
+            cb = extract_tag(split_line, 'CB')
+            cr = extract_tag(split_line, 'CR') if raw and cb is None else None
+            if cb is not None or cr is not None:
+                yield cb, cr, l
+
+
+def bam_cell_records(bam, headers, chain=NO_FILTERS, raw=False):
+    """Yield (cell barcode, raw barcode, line) for the alignments of an open pysam.AlignmentFile that pass the filter chain.
+
+    The barcodes are read from the CB and CR tags of the parsed record as in
+    sam_cell_records, and each record is
+    formatted back to a sam line. When the chain restricts the contigs and the bam is
+    indexed, only those contigs are fetched, so the reads on other contigs are never read.
+    """
+    headers.extend(bam_headers(bam, chain))
+    contigs = chain.contigs()
+    if contigs is not None and bam.has_index():
+        records = itertools.chain.from_iterable(bam.fetch(c) for c in bam.references if c in contigs)
+    else:
+        records = bam.fetch(until_eof=True)
+    return bam_lines(records, chain, raw)
+
+
+def bam_lines(records, chain, raw=False):
+    for record in records:
+        if record.has_tag('CB'):
+            if chain.accepts_bam(record):
+                yield record.get_tag('CB'), None, record.to_string() + '\n'
+        elif raw and record.has_tag('CR') and chain.accepts_bam(record):
+            yield None, record.get_tag('CR'), record.to_string() + '\n'
+
+
+def bam_headers(bam, chain=NO_FILTERS):
+    return [l + '\n' for l in str(bam.header).splitlines() if is_kept_header(l) and chain.keep_header(l)]
+
+
+def open_bam(path, threads=1):
+    import pysam
+    return pysam.AlignmentFile(path, 'rb', threads=threads)
+
+
+def is_bam(path):
+    return path.endswith('.bam')
+
+
+def make_shards(bam, shard_size, contigs=None):
+    """Split the references of an indexed bam into (contig, start, stop) regions of at most shard_size bases.
+
+    A final ('*', None, None) shard holds the unmapped reads without coordinates, so that the
+    shards in order cover the file in the same order as reading it from start to end. If
+    contigs is given, only those contigs are covered.
+    """
+    if shard_size < 1:
+        raise ValueError('shard_size must be at least 1.')
+    shards = []
+    for contig, length in zip(bam.references, bam.lengths):
+        if contigs is None or contig in contigs:
+            for start in range(0, length, shard_size):
+                shards.append((contig, start, min(start + shard_size, length)))
+    if contigs is None:
+        shards.append(('*', None, None))
+    return shards
+
+
+def shard_records(bam, contig, start, stop):
+    if contig == '*':
+        return bam.fetch('*')
+    # A read overlapping two shards is kept only by the shard it starts in.
+    return (r for r in bam.fetch(contig, start, stop) if r.reference_start >= start)
+
+
+_shard_worker = {}
+
+
+def _init_shard_worker(input_, barcodes, parts_dir, chain):
+    _shard_worker.update(input=input_, barcodes=barcodes, parts_dir=parts_dir, chain=chain)
+
+
+def demultiplex_shard(task):
+    """Write the alignments of one shard as 'barcode<TAB>sam line' to its own partial file."""
+    i, (contig, start, stop) = task
+    barcodes = _shard_worker['barcodes']
+    corrected = barcodes.corrected
+    path = os.path.join(_shard_worker['parts_dir'], '%06d.txt' % i)
+    records = 0
+    with open_bam(_shard_worker['input']) as bam:
+        with open(path, 'w') as out:
+            for cb, cr, l in bam_lines(shard_records(bam, contig, start, stop), _shard_worker['chain'],
+                                       barcodes.correct):
+                id = barcodes.lookup(cb, cr)
+                if id is not None:
+                    out.write(id + '\t' + l)
+                    records += 1
+    return path, records, barcodes.corrected - corrected
+
+
+def demultiplex_sharded(input_, barcodes, writer, headers, parts_dir, jobs, shard_size=10000000, chain=NO_FILTERS):
+    """Demultiplex a coordinate-sorted, indexed bam with one worker process per shard.
+
+    Each shard is written to a partial file by a worker; the partial files are then read
+    back in shard order and routed to the per-cell writer, so every cell receives its
+    alignments in the same order as a serial pass.
+    """
+    with open_bam(input_) as bam:
+        if not bam.has_index():
+            raise ValueError('Parallel demultiplexing needs a coordinate-sorted and indexed bam file.')
+        headers.extend(bam_headers(bam, chain))
+        shards = make_shards(bam, shard_size, chain.contigs())
+    os.makedirs(parts_dir)
+    pool = multiprocessing.Pool(jobs, _init_shard_worker, (input_, barcodes, parts_dir, chain))
+    corrected = 0
+    try:
+        for path, _, shard_corrected in pool.imap(demultiplex_shard, enumerate(shards)):
+            corrected += shard_corrected
+            with open(path) as f:
+                for l in f:
+                    id, line = l.split('\t', 1)
+                    writer.write(id, line)
+            os.remove(path)
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        shutil.rmtree(parts_dir, ignore_errors=True)
+    return corrected
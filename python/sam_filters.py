@@ -0,0 +1,91 @@
+BAM_COLUMNS = {
+    2: lambda record: record.reference_name or '*',
+    4: lambda record: str(record.mapping_quality),
+}
+
+
+def read_fasta_ids(path):
+    ids = set()
+    with open(path) as f:
+        for l in f:
+            if l.startswith('>'):
+                seqid = l.split(' ')[0][1:].rstrip()
+                ids.add(seqid)
+    return ids
+
+
+class ColumnFilter(object):
+    """Keep alignments whose value in a sam column is one of the given values."""
+
+    def __init__(self, column, values):
+        self.column = column
+        self.values = frozenset(values)
+
+    def __call__(self, fields):
+        return fields[self.column] in self.values
+
+    def accepts_bam(self, record):
+        return BAM_COLUMNS[self.column](record) in self.values
+
+    def keep_header(self, line):
+        return True
+
+
+class ContigFilter(ColumnFilter):
+    """Keep alignments to the given reference contigs, and only their @SQ header lines."""
+
+    def __init__(self, contigs):
+        super(ContigFilter, self).__init__(2, contigs)
+
+    def keep_header(self, line):
+        return not line.startswith('@SQ') or line.split('\t')[1][3:].rstrip() in self.values
+
+
+def mapq_filter(mapq):
+    return ColumnFilter(4, [str(mapq)])
+
+
+class FilterChain(list):
+    """A list of column filters applied together in one pass; an alignment is kept if all of them accept it.
+
+    Text alignments are tested on their split fields (only the first five columns are needed),
+    bam records on their parsed attributes, so rejected records are never formatted.
+    """
+
+    def accepts(self, line):
+        if not self:
+            return True
+        fields = line.split('\t', 5)
+        for f in self:
+            if not f(fields):
+                return False
+        return True
+
+    def accepts_bam(self, record):
+        for f in self:
+            if not f.accepts_bam(record):
+                return False
+        return True
+
+    def keep_header(self, line):
+        for f in self:
+            if not f.keep_header(line):
+                return False
+        return True
+
+    def contigs(self):
+        """The contigs alignments are restricted to, or None if any contig is accepted."""
+        contigs = None
+        for f in self:
+            if isinstance(f, ContigFilter):
+                contigs = f.values if contigs is None else contigs & f.values
+        return contigs
+
+
+def make_filter_chain(reference_genome=None, mapq=None):
+    chain = FilterChain()
+    if reference_genome is not None:
+        chain.append(ContigFilter(read_fasta_ids(reference_genome)))
+    if mapq is not None:
+        chain.append(mapq_filter(mapq))
+    return chain
@@ -1,9 +1,10 @@
 import os
-import re
 import argparse
 import pysam
 import pandas as pd
 
+from cigar import extract_align_info
+
 
 parser = argparse.ArgumentParser('Count the number of unique UMIs including both from gapped and normal reads that partially or completely fall into the peak range. Notice that in pysam, the positions are 0-based.')
 
@@ -20,8 +21,6 @@ parser.add_argument(
 
 args = parser.parse_args()
 
-UPPERCASE = re.compile(r'([A-Z])')
-
 PATTERNS = {
     'MNM',
     'SMNM',
@@ -74,20 +73,6 @@ def is_header(line):
     return line.startswith('@')
 
 
-def extract_align_info(split_line):
-    sposition1 = int(split_line[3])
-    cigar = {'cha': [], 'len': []}
-    last = None
-    for i, s in enumerate(re.split(UPPERCASE, split_line[5])):
-        if s:
-            if i % 2 == 0:
-                last = int(s)
-            else:
-                cigar['cha'].append(s)
-                cigar['len'].append(last)
-    return sposition1, cigar
-
-
 def extract_umi(split_line):
     for s in split_line:
         if s.startswith('UB:Z:'):
@@ -101,7 +86,7 @@ def get_gapped_umis(file_path):
             if not is_header(line):
                 split_line = line.split('\t')
                 _, cigar = extract_align_info(split_line)
-                pattern = ''.join(cigar['cha'])
+                pattern = cigar.pattern
                 if pattern in PATTERNS:
                     umi = extract_umi(split_line)
                     if umi is not None:
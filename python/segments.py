@@ -0,0 +1,72 @@
+import collections
+
+import numpy as np
+
+# PB2, PB1 and PA of A/Puerto Rico/8/1934 (H1N1), the segments analysed by default
+PR8_POLYMERASES = ['AF389115.1', 'AF389116.1', 'AF389117.1']
+
+
+def read_fasta_lengths(path):
+    """The sequence length of each record of a fasta file, by id in file order."""
+    lengths = collections.OrderedDict()
+    seqid = None
+    with open(path) as f:
+        for l in f:
+            if l.startswith('>'):
+                seqid = l.split(' ')[0][1:].rstrip()
+                lengths[seqid] = 0
+            elif seqid is not None:
+                lengths[seqid] += len(l.strip())
+    return lengths
+
+
+class SegmentRegistry(object):
+    """The segments (reference contigs) of a viral genome under dense integer ids.
+
+    names[i] is the contig name of segment id i and lengths[i] its length (0 if unknown),
+    so per-segment data can be kept in arrays indexed by the segment id.
+    """
+
+    def __init__(self, names, lengths=None):
+        self.names = list(names)
+        if len(set(self.names)) != len(self.names):
+            raise ValueError('Duplicated segment names.')
+        self.ids = dict((name, i) for i, name in enumerate(self.names))
+        self.lengths = np.zeros(len(self.names), dtype=np.int64)
+        if lengths is not None:
+            self.lengths[:] = lengths
+
+    @classmethod
+    def from_files(cls, fasta=None, segments=None):
+        """The segments of a reference fasta, restricted to the given names if any."""
+        lengths = read_fasta_lengths(fasta) if fasta is not None else {}
+        names = list(segments or lengths)
+        missing = [name for name in names if fasta is not None and name not in lengths]
+        if missing:
+            raise ValueError('Segments missing from the reference: %s.' % ', '.join(missing))
+        return cls(names, [lengths.get(name, 0) for name in names])
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def max_length(self):
+        return int(self.lengths.max()) if len(self) else 0
+
+
+PR8_POLYMERASE_REGISTRY = SegmentRegistry(PR8_POLYMERASES, [2341, 2341, 2233])
+
+
+def select_segments(reference_genome=None, segments=None):
+    """The registry of the given reference and segment names, or the PR8 polymerase segments if none is given."""
+    if reference_genome is None and not segments:
+        return PR8_POLYMERASE_REGISTRY
+    if reference_genome is None and all(name in PR8_POLYMERASE_REGISTRY for name in segments):
+        return SegmentRegistry(segments, [PR8_POLYMERASE_REGISTRY.lengths[PR8_POLYMERASE_REGISTRY.ids[name]]
+                                          for name in segments])
+    return SegmentRegistry.from_files(reference_genome, segments)
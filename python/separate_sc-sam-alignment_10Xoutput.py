@@ -1,56 +1,93 @@
 import os
 import argparse
-import re
+
+from sam_demux import (HandlePool, CellWriter, report_stats, make_output_dir, cell_sam_path,
+                       sam_cell_records, bam_cell_records, open_bam, is_bam, demultiplex_sharded)
+from barcodes import BarcodeIndex
+from cell_container import ContainerPool
+from sam_filters import make_filter_chain
 
 parser = argparse.ArgumentParser('Separate sam alignment for individual cells from cell ranger output.')
 
 parser.add_argument(
-    '-i', '--input', required=True, help='sam input file')
+    '-i', '--input', required=True, help='sam input file, or the cell ranger bam file (e.g. possorted_genome_bam.bam) which is read directly with pysam')
 parser.add_argument(
     '-l', '--cb_list', required=True, help='cell barcode list')
 parser.add_argument(
-    '-od', '--output_directory', required=True, help='the directory for all the sam output files')
+    '-c', '--correct_barcodes', action='store_true', help='assign alignments without a CB tag, whose raw CR barcode is one mismatch away from a unique barcode in the list, to that cell; the CB tags are already corrected by cell ranger and are only matched exactly, since a CB one mismatch away from a cell is a different droplet')
+output = parser.add_mutually_exclusive_group(required=True)
+output.add_argument(
+    '-od', '--output_directory', help='the directory for all the sam output files')
+output.add_argument(
+    '--container', help='write all cells to this single sam container, grouped by cell, with a cell offset index (<container>.cidx) instead of one sam file per cell')
+parser.add_argument(
+    '-g', '--reference_genome', help='IAV reference genomes in fasta format; if given, only alignments to these contigs are kept (as filter_IAV_sam.py), and with an indexed bam input only these contigs are read')
+parser.add_argument(
+    '-q', '--mapq', type=int, help='if given, only alignments with this MAPQ are kept (e.g. 255 for unique STAR alignments, as map_qual_filter_forSTARoutput_IAV_sam.py)')
+parser.add_argument(
+    '--max_open_files', type=int, default=512, help='the maximum number of per-cell output files kept open at once (default: 512)')
+parser.add_argument(
+    '--buffer_size', type=int, default=256, help='the total size in MB of alignments buffered in memory across cells before flushing (default: 256)')
+parser.add_argument(
+    '-t', '--threads', type=int, default=1, help='the number of BGZF decompression threads for bam input (default: 1)')
+parser.add_argument(
+    '-j', '--jobs', type=int, default=1, help='the number of worker processes; more than 1 needs a coordinate-sorted and indexed bam input (default: 1)')
+parser.add_argument(
+    '--shard_size', type=int, default=10, help='the size in Mb of the genomic regions handed to each worker process (default: 10)')
 
 args = parser.parse_args()
 
 
-cb = re.compile(r'(?<=CB:Z:).+?(?=\t)')
+def read_cblist(cblf, correct=False):
+    return BarcodeIndex.from_file(cblf, correct=correct)
 
 
-def read_cblist(cblf):
-    with open(cblf) as f:
-        cbl = [l.rstrip() for l in f.readlines()]
-    return cbl
+def process_records(records, cbl, writer):
+    for cb, cr, l in records:
+        id = cbl.lookup(cb, cr)
+        if id is not None:
+            writer.write(id, l)
 
 
-def process_file(input_, cbl, output_dir):
-    if os.path.exists(output_dir):
-        raise ValueError('Output directory already exists.')
-    else:
-        os.makedirs(output_dir)
+def process_file(input_, cbl, output_dir, max_open_files=512, buffer_size=256, threads=1, jobs=1, shard_size=10,
+                 container=None, chain=None):
+    if jobs > 1 and not is_bam(input_):
+        raise ValueError('Parallel demultiplexing (--jobs) needs a bam input file.')
+    if chain is None:
+        chain = make_filter_chain()
     headers = []
-    ids = set()
-    with open(input_) as f:
-        for l in f:
-            if l.startswith('@HD'):
-                headers.append(l)
-            elif l.startswith('@SQ'):
-                headers.append(l)
-            elif not l.startswith('@'):
-                id = cb.findall(l)
-                if len(id) == 1:
-                    id = id[0]
-                    if id in cbl:
-                        if id not in ids:
-                            ids.add(id)
-                            with open(os.path.join(output_dir, '%s.sam' % id), 'w') as f:
-                                f.writelines(headers)
-                                f.write(l)
-                        else:
-                            with open(os.path.join(output_dir, '%s.sam' % id), 'a') as f:
-                                f.write(l)
+    if container is not None:
+        pool = ContainerPool(container, headers)
+        parts_dir = container + '.shards'
+    else:
+        make_output_dir(output_dir)
+        pool = HandlePool(cell_sam_path(output_dir), headers, max_open=max_open_files)
+        parts_dir = os.path.join(output_dir, '.shards')
+    writer = CellWriter(pool, buffer_size=buffer_size << 20)
+    try:
+        if jobs > 1:
+            cbl.corrected += demultiplex_sharded(input_, cbl, writer, headers, parts_dir, jobs, shard_size * 1000000,
+                                                 chain)
+        elif is_bam(input_):
+            with open_bam(input_, threads) as bam:
+                process_records(bam_cell_records(bam, headers, chain, cbl.correct), cbl, writer)
+        else:
+            with open(input_) as f:
+                process_records(sam_cell_records(f, headers, chain, cbl.correct), cbl, writer)
+    finally:
+        writer.close()
+    stats = writer.stats()
+    stats['corrected'] = cbl.corrected
+    return stats
 
 
 if __name__ == '__main__':
-    cbl = read_cblist(args.cb_list)
-    process_file(args.input, cbl, args.output_directory)
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1.')
+    if args.shard_size < 1:
+        parser.error('--shard_size must be at least 1.')
+    cbl = read_cblist(args.cb_list, args.correct_barcodes)
+    chain = make_filter_chain(args.reference_genome, args.mapq)
+    stats = process_file(args.input, cbl, args.output_directory, args.max_open_files, args.buffer_size, args.threads,
+                         args.jobs, args.shard_size, args.container, chain)
+    report_stats(stats)
@@ -0,0 +1,83 @@
+import collections
+
+import numpy as np
+
+# the cigar operations covering the reference as bedtools genomecov -split counts them: M, D, = and X;
+# N (3) is the skipped region of a split read, I, S, H and P do not consume the reference
+COVERING_OPS = frozenset([0, 2, 7, 8])
+REF_OPS = frozenset([0, 2, 3, 7, 8])
+
+BLOCK_BATCH = 1 << 16
+
+
+def _open_alignments(path):
+    try:
+        import pysam
+    except ImportError:
+        raise ImportError('Reading the coverage from alignment files needs pysam.')
+    return pysam.AlignmentFile(path)
+
+
+class SplitCoverage(object):
+    """Per-base coverage of reference contigs from the aligned blocks of split reads.
+
+    The blocks are collected as (contig, start, end) and added in batches to one
+    difference array per contig: +1 at the 0-based start and -1 at the end of each block,
+    so the coverage is the cumulative sum.
+    """
+
+    def __init__(self, lengths):
+        self.names = list(lengths)
+        self.diffs = [np.zeros(lengths[name] + 1, dtype=np.int64) for name in self.names]
+        self._blocks = ([], [], [])
+
+    def add_read(self, contig, start, cigartuples):
+        """Add the blocks of a read aligned to contig id (the index in lengths) from 0-based start."""
+        contigs, starts, ends = self._blocks
+        position = start
+        for op, length in cigartuples:
+            if op in REF_OPS:
+                if op in COVERING_OPS:
+                    if ends and ends[-1] == position and contigs[-1] == contig:
+                        ends[-1] = position + length
+                    else:
+                        contigs.append(contig)
+                        starts.append(position)
+                        ends.append(position + length)
+                position += length
+        if len(starts) >= BLOCK_BATCH:
+            self.flush()
+
+    def flush(self):
+        contigs, starts, ends = [np.array(column, dtype=np.int64) for column in self._blocks]
+        self._blocks = ([], [], [])
+        for i in np.unique(contigs).tolist():
+            selected = contigs == i
+            diff = self.diffs[i]
+            diff += np.bincount(np.minimum(starts[selected], len(diff) - 1), minlength=len(diff))
+            diff -= np.bincount(np.minimum(ends[selected], len(diff) - 1), minlength=len(diff))
+
+    def per_base(self):
+        """The coverage of each base of each contig, {contig: array} with base i at index i - 1."""
+        self.flush()
+        return collections.OrderedDict((name, np.cumsum(diff[:-1])) for name, diff in zip(self.names, self.diffs))
+
+
+def read_split_coverage(path):
+    """The split-aware per-base coverage of each reference contig of a bam (or sam) file.
+
+    The same as bedtools genomecov -d -split on the file, without the per-base text file:
+    every mapped read covers the bases of its M, D, = and X operations and skips its N
+    regions. The file does not need to be sorted.
+    """
+    with _open_alignments(path) as f:
+        coverage = SplitCoverage(collections.OrderedDict(zip(f.references, f.lengths)))
+        for read in f:
+            if not read.is_unmapped:
+                coverage.add_read(read.reference_id, read.reference_start, read.cigartuples)
+    return coverage.per_base()
+
+
+def average_coverage(per_base):
+    """The average coverage over all the bases of each contig."""
+    return dict((name, float(depth.sum()) / len(depth) if len(depth) else np.nan) for name, depth in per_base.items())
@@ -0,0 +1,197 @@
+import os
+import collections
+
+from barcodes import BarcodeIndex
+from cell_batch import cell_id, map_cells, write_count_matrix
+from cell_container import open_input
+from cigar import extract_align_info, ref_end, compile_patterns
+from result_cache import cached, file_digest
+
+# the patterns whose UMIs are counted as viral when the alignment is within the gtf range of
+# its segment; the other alignments are counted when they are assigned to a gene (GX tag)
+PATTERNS = compile_patterns([
+    'MNM', 'SMNM', 'MNMS', 'MNMDM', 'SMNMS', 'MDMNM', 'MNMIM', 'MIMNM', 'MNMNM', 'SMDMNM', 'MNMDMS',
+    'SMNMDM', 'SMNMIM', 'SMIMNM', 'MDMNMS', 'MIMNMS', 'MNMIMS', 'MDMIMNM', 'SMDMNMS', 'SMNMIMS',
+    'SMIMNMS', 'MDMDMNM', 'MNMIMIM', 'SMNMDMS', 'MNMDMDM', 'MNMDMIM', 'MNMNMS', 'MIMDMNM', 'MIMIMNM',
+    'MNMIMDM', 'MDMNMIMS', 'SMIMNMDM', 'MIMNMIM', 'MIMNMNM', 'MDMNMIM', 'MIMNMDM', 'SMNMNM', 'MDMNMDM',
+    'MNMIMNM', 'MNMDMNM', 'MNMNMIM', 'MNMNMDM'])
+# the gapped alignments of DIs with one internal deletion; the ones with two Ns are excluded
+GAPPED_PATTERNS = compile_patterns([pattern for pattern in PATTERNS if pattern.count('N') == 1])
+
+# output -> the name of its file for each cell in the batch mode, after the cell id
+CELL_OUTPUTS = collections.OrderedDict([
+    ('sam', '.sam'),
+    ('all_counts', '_all_UMI_counts.txt'),
+    ('gapped_counts', '_gapped_rcounts.txt'),
+])
+
+
+def is_header(line):
+    return line.startswith('@')
+
+
+def is_in_range(cigar, split_line, gtf):
+    segment = split_line[2]
+    info = gtf[segment]
+    firstbase = int(split_line[3])
+    lastbase = ref_end(firstbase, cigar)
+    return (info['min'] <= firstbase) and (lastbase <= info['max'])
+
+
+def assgined_to_gene (split_line):
+    for s in split_line:
+        if s.startswith('GX:Z:'):
+            return True
+    return False
+
+
+def extract_umi(split_line):
+    for s in split_line:
+        if s.startswith('UB:Z:'):
+            return s[5:]
+
+
+def extract_cb(split_line):
+    for s in split_line:
+        if s.startswith('CB:Z:'):
+            return s[5:].rstrip()
+
+
+def read_gtf(path):
+    """The {'min': start, 'max': end} range of each segment of a gtf file, the last line of a segment wins."""
+    gtf = {}
+    with open(path) as f:
+        for line in f:
+            split_line = line.split('\t')
+            gtf[split_line[0]] = {
+                'min': int(split_line[3]),
+                'max': int(split_line[4])
+            }
+    return gtf
+
+
+def count_umis(input_sam_file, gtf, cbl, count_all=True, keep_gapped=True):
+    """Stream the alignments of a cell once into the UMI counts of all alignments and/or the gapped ones.
+
+    Returns the headers, the number of all UMIs of each segment (None unless count_all)
+    and the first alignment of each gapped UMI of each segment (None unless keep_gapped),
+    both by segment in sorted order. Only the kept alignments and the UMI sets are held in
+    memory, so the memory grows with the number of distinct UMIs rather than the input size.
+    """
+    headers = []
+    umis = {}
+    gapped_umis = {}
+    gapped_lines = {}
+    with open_input(input_sam_file) as f:
+        for line in f:
+            if is_header(line):
+                headers.append(line)
+                continue
+            split_line = line.split('\t')
+            if cbl is not None and extract_cb(split_line) not in cbl:
+                continue
+            seg = split_line[2]
+            if seg not in umis:
+                umis[seg] = set()
+                gapped_umis[seg] = set()
+                gapped_lines[seg] = []
+            sposition1, cigar = extract_align_info(split_line)
+            if cigar.pattern in PATTERNS:
+                gapped = keep_gapped and cigar.pattern in GAPPED_PATTERNS
+                if count_all or gapped:
+                    umi = extract_umi(split_line)
+                    # the range of a gapped alignment whose UMI is already kept is only needed for all the UMIs
+                    new_gapped = gapped and umi not in gapped_umis[seg]
+                    if umi is not None and (count_all or new_gapped) and is_in_range(cigar, split_line, gtf):
+                        if count_all:
+                            umis[seg].add(umi)
+                        if new_gapped:
+                            gapped_umis[seg].add(umi)
+                            gapped_lines[seg].append(line)
+            elif count_all and assgined_to_gene(split_line):
+                umi = extract_umi(split_line)
+                if umi is not None:
+                    umis[seg].add(umi)
+
+    all_counts = collections.OrderedDict() if count_all else None
+    gapped_segs = collections.OrderedDict() if keep_gapped else None
+    for seg in sorted(umis):
+        if count_all:
+            all_counts[seg] = len(umis[seg])
+        if keep_gapped:
+            gapped_segs[seg] = gapped_lines[seg]
+    return headers, all_counts, gapped_segs
+
+
+def segment_counts(result, output):
+    """The {segment: count} of a count output ('all_counts' or 'gapped_counts') of a count_umis result."""
+    headers, all_counts, gapped_segs = result
+    if output == 'all_counts':
+        return all_counts
+    return collections.OrderedDict((seg, len(lines)) for seg, lines in gapped_segs.items())
+
+
+def write_outputs(result, paths):
+    """Write the outputs of a count_umis result, paths maps each output of CELL_OUTPUTS to its file."""
+    for output, path in paths.items():
+        with open(path, 'w') as f:
+            if output == 'sam':
+                headers, all_counts, gapped_segs = result
+                f.writelines(headers)
+                for seg, gapped_lines in gapped_segs.items():
+                    f.writelines(gapped_lines)
+            else:
+                for seg, count in segment_counts(result, output).items():
+                    f.write('{}\t{}\n'.format(seg, count))
+
+
+def counted_cell(input_sam_file, gtf, cbl, cache, params):
+    """The count_umis result of one cell, from the cache when it holds one for the same content and params."""
+    return cached(cache, 'viral_umi_counts', input_sam_file, params,
+                  lambda: count_umis(input_sam_file, gtf, cbl, params['count_all'], params['keep_gapped']))
+
+
+def process_cell(input_sam_file, gtf, cbl, cache, params, outputs, output_dir, matrices):
+    """Count the UMIs of one cell of a batch, writing its outputs to output_dir if given.
+
+    Returns the cell id and the {segment: count} of each of the matrices.
+    """
+    result = counted_cell(input_sam_file, gtf, cbl, cache, params)
+    cid = cell_id(input_sam_file)
+    if output_dir is not None:
+        write_outputs(result, dict((output, os.path.join(output_dir, cid + CELL_OUTPUTS[output])) for output in outputs))
+    return cid, dict((output, segment_counts(result, output)) for output in matrices)
+
+
+def load_counting(gtf_file, cb_list, outputs):
+    """The gtf ranges, the barcode list and the cache params of counting the given outputs."""
+    gtf = read_gtf(gtf_file)
+    cbl = None
+    if cb_list is not None:
+        cbl = BarcodeIndex.from_file(cb_list)
+    params = {'gtf': file_digest(gtf_file),
+              'cb_list': file_digest(cb_list) if cb_list is not None else None,
+              'count_all': 'all_counts' in outputs,
+              'keep_gapped': 'sam' in outputs or 'gapped_counts' in outputs}
+    return gtf, cbl, params
+
+
+def run_umi_counting(inputs, gtf_file, outputs, output_dir=None, matrices=None, cb_list=None, jobs=1, cache=None):
+    """Count the UMIs of many cells, writing the outputs of each cell to output_dir and/or the count matrices.
+
+    outputs are the per-cell outputs of CELL_OUTPUTS written to output_dir, and matrices
+    maps 'all_counts' and/or 'gapped_counts' to the csv file of their counts of all cells,
+    one column per cell (see write_count_matrix).
+    """
+    matrices = dict((output, path) for output, path in (matrices or {}).items() if path is not None)
+    gtf, cbl, params = load_counting(gtf_file, cb_list, list(outputs) + list(matrices))
+    counts = list(map_cells(process_cell, inputs, jobs, gtf=gtf, cbl=cbl, cache=cache, params=params,
+                            outputs=outputs, output_dir=output_dir, matrices=list(matrices)))
+    for output, path in matrices.items():
+        write_count_matrix([(cid, cell_counts[output]) for cid, cell_counts in counts], path)
+
+
+def count_sam_file(input_sam_file, gtf_file, paths, cb_list=None, cache=None):
+    """Count the UMIs of one sam file or container cell, paths maps each output of CELL_OUTPUTS to its file."""
+    gtf, cbl, params = load_counting(gtf_file, cb_list, paths)
+    write_outputs(counted_cell(input_sam_file, gtf, cbl, cache, params), paths)